@@ -1,6 +1,7 @@
 from gym.envs import register
 
 from diayn.environments.ua1_gym import ALL_GYM_ENVS
+from diayn.environments.ua1_batch import ALL_BATCH_ENVS
 
 for name, env_fn in ALL_GYM_ENVS.items():
     env_id = f'UA1{name.capitalize()}-v0'
@@ -8,3 +9,10 @@ for name, env_fn in ALL_GYM_ENVS.items():
         id=env_id,
         entry_point=env_fn
     )
+
+for name, env_fn in ALL_BATCH_ENVS.items():
+    env_id = f'UA1{name.capitalize()}Batch-v0'
+    register(
+        id=env_id,
+        entry_point=env_fn
+    )
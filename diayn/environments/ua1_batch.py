@@ -0,0 +1,191 @@
+import gym
+import numpy as np
+from dm_control.rl import control
+from diayn.physics import Physics
+from diayn.task import TASK_TO_SPEED, Move
+from diayn.utils import OpenCVImageViewer, get_model_and_assets
+
+
+class BatchedDMSuiteEnv(gym.Env):
+    """Steps ``num_envs`` A1 robots with a single Python call.
+
+    All instances share one compiled ``MjModel`` and only own their ``MjData``,
+    so the XML is parsed and compiled once regardless of ``num_envs``. The
+    ``control.Environment`` loop is inlined here to skip the per-env
+    ``TimeStep`` and observation-dict flattening overhead: observations are
+    written straight into a preallocated ``(num_envs, obs_dim)`` array.
+
+    Instances are reset automatically when their episode ends. In that case
+    the returned observation is the first one of the new episode and the
+    final observation of the finished episode is available in
+    ``info[i]["terminal_observation"]``.
+    """
+
+    def __init__(
+        self,
+        task_type,
+        num_envs=16,
+        seed=None,
+        time_limit=20.0,
+        control_timestep=0.02,
+    ):
+        xml_string, assets = get_model_and_assets()
+        base_physics = Physics.from_xml_string(xml_string, assets)
+        self.physics = [base_physics] + [
+            base_physics.copy(share_model=True) for _ in range(num_envs - 1)
+        ]
+        self.tasks = [
+            Move(task_type, random=None if seed is None else seed + i)
+            for i in range(num_envs)
+        ]
+        self.num_envs = num_envs
+
+        self._n_sub_steps = control.compute_n_steps(
+            control_timestep, base_physics.timestep()
+        )
+        self._step_limit = time_limit / (base_physics.timestep() * self._n_sub_steps)
+        self._step_count = np.zeros(num_envs, dtype=np.int64)
+
+        # Lay out the flattened observation once, then reuse the slices
+        for physics, task in zip(self.physics, self.tasks):
+            with physics.reset_context():
+                task.initialize_episode(physics)
+        observation = self.tasks[0].get_observation(self.physics[0])
+        self._obs_slices, start = [], 0
+        for value in observation.values():
+            size = np.size(value)
+            self._obs_slices.append(slice(start, start + size))
+            start += size
+        self._obs = np.zeros((num_envs, start), dtype=np.float64)
+        self._rew = np.zeros(num_envs, dtype=np.float64)
+        self._done = np.zeros(num_envs, dtype=bool)
+
+        self.metadata = {
+            "render.modes": ["human", "rgb_array"],
+            "video.frames_per_second": round(
+                1.0 / (base_physics.timestep() * self._n_sub_steps)
+            ),
+        }
+        action_spec = self.tasks[0].action_spec(base_physics)
+        self.single_action_space = gym.spaces.Box(
+            low=action_spec.minimum, high=action_spec.maximum, dtype=action_spec.dtype
+        )
+        self.single_observation_space = gym.spaces.Box(
+            low=-float("inf"), high=float("inf"), shape=(start,), dtype=np.float64
+        )
+        self.action_space = gym.spaces.Box(
+            low=np.tile(self.single_action_space.low, (num_envs, 1)),
+            high=np.tile(self.single_action_space.high, (num_envs, 1)),
+            dtype=action_spec.dtype,
+        )
+        self.observation_space = gym.spaces.Box(
+            low=-float("inf"), high=float("inf"), shape=self._obs.shape, dtype=np.float64
+        )
+        self.viewer = None
+
+    def _write_obs(self, i):
+        observation = self.tasks[i].get_observation(self.physics[i])
+        row = self._obs[i]
+        for sl, value in zip(self._obs_slices, observation.values()):
+            row[sl] = np.ravel(value)
+
+    def _reset_one(self, i):
+        self._step_count[i] = 0
+        with self.physics[i].reset_context():
+            self.tasks[i].initialize_episode(self.physics[i])
+        self._write_obs(i)
+
+    def seed(self, seed):
+        for i, task in enumerate(self.tasks):
+            task.random.seed(seed + i)
+        self.action_space.seed(seed)
+
+    def reset(self):
+        for i in range(self.num_envs):
+            self._reset_one(i)
+        return self._obs.copy()
+
+    def step(self, actions):
+        infos = [{} for _ in range(self.num_envs)]
+        for i, (physics, task) in enumerate(zip(self.physics, self.tasks)):
+            task.before_step(actions[i], physics)
+            physics.step(self._n_sub_steps)
+            task.after_step(physics)
+
+            self._rew[i] = task.get_reward(physics)
+            self._step_count[i] += 1
+            if self._step_count[i] >= self._step_limit:
+                discount = 1.0
+            else:
+                discount = task.get_termination(physics)
+            self._done[i] = discount is not None
+
+            if self._done[i]:
+                self._write_obs(i)
+                infos[i]["terminal_observation"] = self._obs[i].copy()
+                infos[i]["discount"] = discount
+                self._reset_one(i)
+            else:
+                self._write_obs(i)
+        return self._obs.copy(), self._rew.copy(), self._done.copy(), infos
+
+    def render(self, mode="human", env_index=0, **kwargs):
+        if "camera_id" not in kwargs:
+            kwargs["camera_id"] = 0  # Tracking camera
+
+        img = self.physics[env_index].render(**kwargs)
+        if self.viewer is None and mode == "human":
+            self.viewer = OpenCVImageViewer()
+
+        if self.viewer:
+            self.viewer.imshow(img)
+
+        return img
+
+    def close(self):
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
+        for physics in self.physics:
+            physics.free()
+
+
+ALL_BATCH_ENVS = {}
+for task_type in TASK_TO_SPEED:
+    ALL_BATCH_ENVS[task_type] = lambda tt=task_type, **kwargs: BatchedDMSuiteEnv(
+        tt, **kwargs
+    )
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Test a given batched environment.")
+    parser.add_argument(
+        "--task",
+        type=str,
+        help="Move task to test: `none`, `still`, `slow`, or `fast`",
+        default="none",
+    )
+    parser.add_argument("--num_envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    assert args.task in ALL_BATCH_ENVS.keys(), f"Unknown environment: {args.task}"
+    env = ALL_BATCH_ENVS[args.task](num_envs=args.num_envs, seed=0)
+
+    env.reset()
+    start = time.time()
+    for _ in range(args.steps):
+        _, reward, done, _ = env.step(env.action_space.sample())
+    elapsed = time.time() - start
+    print(
+        "{} envs x {} steps in {:.2f}s = {:.0f} env steps/s.".format(
+            args.num_envs, args.steps, elapsed, args.num_envs * args.steps / elapsed
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
+import copy
 import gym
 from dm_env import specs
 from diayn.environments.ua1_dmc import ALL_DMC_ENVS
-from diayn.utils import OpenCVImageViewer
+from diayn.utils import OpenCVImageViewer, get_control_state, set_control_state
 
 
 
@@ -54,6 +55,18 @@ class DMSuiteEnv(gym.Env):
     def seed(self, seed):
         return self.env.task.random.seed(seed)
 
+    def get_state(self):
+        """Everything needed to continue the current episode, see ``set_state``."""
+        return dict(
+            env=get_control_state(self.env),
+            action_space=copy.deepcopy(self.action_space),
+        )
+
+    def set_state(self, state):
+        """Restore the episode and the action sampler saved by ``get_state``."""
+        set_control_state(self.env, state["env"])
+        self.action_space = copy.deepcopy(state["action_space"])
+
     def step(self, action):
         timestep = self.env.step(action)
         # TODO: Fix this hacky way to get the observation
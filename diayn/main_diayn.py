@@ -6,6 +6,7 @@ import dmc2gym
 
 import diayn as diayn_m
 from diayn.spinningup.spinup.algos.pytorch.diayn.diayn import core, diayn
+from diayn.spinningup.spinup.utils.mpi_tools import mpi_fork, proc_id
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -40,6 +41,41 @@ if __name__ == "__main__":
     # update_after=1000, update_every=50, num_test_episodes=10, max_ep_len=1000,
     parser.add_argument("--hid", type=int, default=256)
     parser.add_argument("--l", type=int, default=2)
+    parser.add_argument(
+        "--from_pixels",
+        action="store_true",
+        help="Learn from rendered frames with a CNN actor-critic (dm_control envs, one process)",
+    )
+    parser.add_argument(
+        "--frame_stack",
+        type=int,
+        default=3,
+        help="Frames per pixel observation, each stored once in the replay buffer",
+    )
+    parser.add_argument(
+        "--cpu",
+        type=int,
+        default=1,
+        help="Number of MPI processes collecting experience (process 0 also learns)",
+    )
+    parser.add_argument(
+        "--data_parallel",
+        action="store_true",
+        help="Make every MPI process a learner, splitting each minibatch between them",
+    )
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--updates_per_step", type=int, default=1)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue this run from its last full training-state checkpoint",
+    )
+    parser.add_argument(
+        "--checkpoint_freq",
+        type=int,
+        default=10,
+        help="Epochs between full training-state checkpoints (the last epoch is always saved)",
+    )
     # hidden_sizes=(256,256),
     # activation=nn.ReLU
     args = parser.parse_args()
@@ -48,6 +84,8 @@ if __name__ == "__main__":
         args.domain_name and args.task_name
     ), "Can't create environment"
 
+    mpi_fork(args.cpu)  # run parallel code with mpi
+
     from diayn.spinningup.spinup.utils.run_utils import setup_logger_kwargs
 
     env_folder = args.env_id if args.env_id else f"{args.domain_name}_{args.task_name}"
@@ -58,14 +96,19 @@ if __name__ == "__main__":
         lambda: gym.make(args.env_id)
         if args.env_id
         else dmc2gym.make(
-            domain_name=args.domain_name, task_name=args.task_name, seed=args.seed
+            domain_name=args.domain_name,
+            task_name=args.task_name,
+            seed=args.seed + 10000 * proc_id(),
+            visualize_reward=not args.from_pixels,
+            from_pixels=args.from_pixels,
+            frame_stack=args.frame_stack if args.from_pixels else 1,
         )
     )
 
     torch.set_num_threads(torch.get_num_threads())
     diayn(
         env_fn,
-        actor_critic=core.MLPActorCritic,
+        actor_critic=core.CNNActorCritic if args.from_pixels else core.MLPActorCritic,
         ac_kwargs=dict(hidden_sizes=[args.hid] * args.l),
         n_skill=args.n_skill,
         curriculum_threshold=args.curriculum_threshold,
@@ -77,5 +120,11 @@ if __name__ == "__main__":
         seed=args.seed,
         epochs=args.epochs,
         steps_per_epoch=args.steps_per_epoch,
+        batch_size=args.batch_size,
+        updates_per_step=args.updates_per_step,
         logger_kwargs=logger_kwargs,
+        checkpoint_freq=args.checkpoint_freq,
+        resume=args.resume,
+        data_parallel=args.data_parallel,
+        frame_stack=args.frame_stack if args.from_pixels else None,
     )
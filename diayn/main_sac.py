@@ -33,6 +33,17 @@ if __name__ == "__main__":
     # update_after=1000, update_every=50, num_test_episodes=10, max_ep_len=1000,
     parser.add_argument("--hid", type=int, default=256)
     parser.add_argument("--l", type=int, default=2)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue this run from its last full training-state checkpoint",
+    )
+    parser.add_argument(
+        "--checkpoint_freq",
+        type=int,
+        default=10,
+        help="Epochs between full training-state checkpoints (the last epoch is always saved)",
+    )
     # hidden_sizes=(256,256),
     # activation=nn.ReLU
     args = parser.parse_args()
@@ -68,4 +79,6 @@ if __name__ == "__main__":
         epochs=args.epochs,
         steps_per_epoch=args.steps_per_epoch,
         logger_kwargs=logger_kwargs,
+        checkpoint_freq=args.checkpoint_freq,
+        resume=args.resume,
     )
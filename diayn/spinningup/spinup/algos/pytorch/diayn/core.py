@@ -108,3 +108,74 @@ class MLPActorCritic(nn.Module):
         with torch.no_grad():
             a, _ = self.pi(sk, obs, deterministic, False)
             return a.numpy()
+
+
+class CNNEncoder(nn.Module):
+    """Flattened conv features of channels-first uint8 images (or batches of them)."""
+
+    def __init__(self, obs_shape, channels, activation):
+        super().__init__()
+        self.obs_shape = tuple(obs_shape)
+        layers, in_ch = [], obs_shape[0]
+        for j, ch in enumerate(channels):
+            layers += [nn.Conv2d(in_ch, ch, 3, stride=2 if j == 0 else 1), activation()]
+            in_ch = ch
+        self.net = nn.Sequential(*layers, nn.Flatten())
+        with torch.no_grad():
+            self.out_dim = self.net(torch.zeros(1, *self.obs_shape)).shape[1]
+
+    def forward(self, obs):
+        feat = self.net(obs.reshape(-1, *self.obs_shape) / 255.0)
+        return feat.reshape(obs.shape[:-3] + (self.out_dim,))
+
+class CNNSquashedGaussianActor(SquashedGaussianMLPActor):
+
+    def __init__(self, sk_dim, obs_shape, act_dim, hidden_sizes, activation, act_limit, channels):
+        encoder = CNNEncoder(obs_shape, channels, activation)
+        super().__init__(sk_dim, encoder.out_dim, act_dim, hidden_sizes, activation, act_limit)
+        self.encoder = encoder
+
+    def forward(self, sk, obs, deterministic=False, with_logprob=True):
+        return super().forward(sk, self.encoder(obs), deterministic, with_logprob)
+
+class CNNQFunction(MLPQFunction):
+
+    def __init__(self, sk_dim, obs_shape, act_dim, hidden_sizes, activation, channels):
+        encoder = CNNEncoder(obs_shape, channels, activation)
+        super().__init__(sk_dim, encoder.out_dim, act_dim, hidden_sizes, activation)
+        self.encoder = encoder
+
+    def forward(self, sk, obs, act):
+        return super().forward(sk, self.encoder(obs), act)
+
+class CNNDiscriminator(MLPDiscriminator):
+
+    def __init__(self, obs_shape, sk_dim, hidden_sizes, activation, channels):
+        encoder = CNNEncoder(obs_shape, channels, activation)
+        super().__init__(encoder.out_dim, sk_dim, hidden_sizes, activation)
+        self.encoder = encoder
+
+    def forward(self, obs):
+        return super().forward(self.encoder(obs))
+
+class CNNActorCritic(MLPActorCritic):
+    """
+    Actor-critic for pixel observations: like ``MLPActorCritic``, but pi,
+    q1, q2 and the discriminator each read the image through their own
+    ``CNNEncoder`` (one conv layer per entry of ``channels``).
+    """
+
+    def __init__(self, sk_dim, observation_space, action_space, hidden_sizes=(256,256),
+                 activation=nn.ReLU, channels=(32,32,32)):
+        nn.Module.__init__(self)
+
+        obs_shape = observation_space.shape
+        act_dim = action_space.shape[0]
+        act_limit = action_space.high[0]
+
+        # build discriminator, policy, and value functions
+        self.pi = CNNSquashedGaussianActor(sk_dim, obs_shape, act_dim, hidden_sizes, activation,
+                                           act_limit, channels)
+        self.q1 = CNNQFunction(sk_dim, obs_shape, act_dim, hidden_sizes, activation, channels)
+        self.q2 = CNNQFunction(sk_dim, obs_shape, act_dim, hidden_sizes, activation, channels)
+        self.di = CNNDiscriminator(obs_shape, sk_dim, hidden_sizes, activation, channels)
@@ -7,7 +7,13 @@ from torch.optim import Adam
 import gym
 import time
 import diayn.spinningup.spinup.algos.pytorch.diayn.core as core
-from diayn.spinningup.spinup.utils.logx import EpochLogger
+from diayn.spinningup.spinup.utils.logx import EpochLogger, pytorch_model_spec
+from diayn.spinningup.spinup.utils.checkpoint import (
+    CheckpointWriter, get_env_state, get_rng_state, latest_checkpoint,
+    load_checkpoint, set_env_state, set_rng_state)
+from diayn.spinningup.spinup.utils.mpi_pytorch import mpi_avg_grads, setup_pytorch_for_mpi, sync_params
+from diayn.spinningup.spinup.utils.mpi_tools import (
+    allgather, broadcast, broadcast_object, gather, num_procs, proc_id)
 
 EPS = torch.as_tensor(1E-6, dtype=torch.float32)
 
@@ -27,7 +33,8 @@ class ReplayBuffer:
         self.done_buf = np.zeros(size, dtype=np.float32)
         self.ptr, self.size, self.max_size = 0, 0, size
 
-    def store(self, sk, obs, act, rew, irew, wrew, next_obs, done):
+    def store(self, sk, obs, act, rew, irew, wrew, next_obs, done, first=False):
+        # ``first`` (episode start) only matters to FrameStackReplayBuffer
         self.sk_buf[self.ptr] = sk
         self.obs_buf[self.ptr] = obs
         self.obs2_buf[self.ptr] = next_obs
@@ -53,6 +60,156 @@ class ReplayBuffer:
         )
         return {k: torch.as_tensor(v, dtype=torch.float32) for k, v in batch.items()}
 
+    def _bufs(self):
+        return [self.sk_buf, self.obs_buf, self.obs2_buf, self.act_buf,
+                self.rew_buf, self.irew_buf, self.wrew_buf, self.done_buf]
+
+    def packed(self):
+        """
+        The stored transitions as one (size, width) float32 array, oldest
+        first. Only meant for a buffer which hasn't wrapped around.
+        """
+        return np.concatenate(
+            [buf[: self.size].reshape(self.size, -1) for buf in self._bufs()], axis=1)
+
+    def store_packed(self, rows):
+        """Store the transitions in an array made by another buffer's ``packed``."""
+        idxs = (self.ptr + np.arange(len(rows))) % self.max_size
+        col = 0
+        for buf in self._bufs():
+            width = int(np.prod(buf.shape[1:]))
+            buf[idxs] = rows[:, col : col + width].reshape((len(rows),) + buf.shape[1:])
+            col += width
+        self.ptr = (self.ptr + len(rows)) % self.max_size
+        self.size = min(self.size + len(rows), self.max_size)
+
+    def clear(self):
+        self.ptr, self.size = 0, 0
+
+    def state_dict(self):
+        """The stored transitions and write position, for checkpointing."""
+        state = {k: v[: self.size] for k, v in vars(self).items() if k.endswith("_buf")}
+        state.update(ptr=self.ptr, size=self.size)
+        return state
+
+    def load_state_dict(self, state):
+        for k, v in state.items():
+            if k.endswith("_buf"):
+                getattr(self, k)[: len(v)] = v
+        self.ptr, self.size = state["ptr"], state["size"]
+
+
+class FrameStackReplayBuffer:
+    """
+    A FIFO experience replay buffer for DIAYN agents on stacked pixel
+    observations, which stores every rendered frame only once.
+
+    Observations are channels-first stacks of ``frame_stack`` uint8 frames,
+    oldest first, as produced by ``dmc2gym.make(from_pixels=True,
+    frame_stack=k)``. Each slot keeps the newest frame of ``next_obs``, and
+    each episode takes one extra slot for its reset frame, so the caller
+    marks the first transition of every episode with ``first=True``. The
+    ``obs`` and ``obs2`` stacks are rebuilt by index at sample time,
+    repeating the reset frame at the start of an episode just like the
+    env-side frame stack.
+
+    Frame memory for 1e6 transitions of 3x84x84 frames with ``frame_stack=3``:
+
+    =========================================  =========
+    Storage                                    Size
+    =========================================  =========
+    ``ReplayBuffer`` (float32 obs and obs2)    ~508 GB
+    uint8 obs and obs2 stacks                  ~127 GB
+    ``FrameStackReplayBuffer``                 ~21 GB
+    =========================================  =========
+    """
+
+    def __init__(self, sk_dim, obs_dim, act_dim, size, frame_stack):
+        self.frame_stack = frame_stack
+        self.frame_shape = (obs_dim[0] // frame_stack,) + tuple(obs_dim[1:])
+        self.frame_buf = np.zeros(core.combined_shape(size, self.frame_shape), dtype=np.uint8)
+        self.sk_buf = np.zeros(core.combined_shape(size, sk_dim), dtype=np.float32)
+        self.act_buf = np.zeros(core.combined_shape(size, act_dim), dtype=np.float32)
+        self.rew_buf = np.zeros(size, dtype=np.float32)
+        self.irew_buf = np.zeros(size, dtype=np.float32)
+        self.wrew_buf = np.zeros(size, dtype=np.float32)
+        self.done_buf = np.zeros(size, dtype=np.float32)
+        # absolute (never wrapped) index of each slot and of its episode's
+        # reset frame, and whether the slot holds a transition at all
+        self.abs_buf = np.zeros(size, dtype=np.int64)
+        self.start_buf = np.zeros(size, dtype=np.int64)
+        self.valid_buf = np.zeros(size, dtype=bool)
+        self.ptr, self.size, self.max_size = 0, 0, size
+        self.total, self.ep_start = 0, 0
+
+    def _push_frame(self, frame, valid):
+        slot = self.ptr
+        self.frame_buf[slot] = frame
+        self.abs_buf[slot] = self.total
+        self.start_buf[slot] = self.ep_start
+        self.valid_buf[slot] = valid
+        self.total += 1
+        self.ptr = (self.ptr + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+        return slot
+
+    def store(self, sk, obs, act, rew, irew, wrew, next_obs, done, first=False):
+        n_channels = self.frame_shape[0]
+        if first:
+            self.ep_start = self.total
+            self._push_frame(obs[-n_channels:], False)
+        slot = self._push_frame(next_obs[-n_channels:], True)
+        self.sk_buf[slot] = sk
+        self.act_buf[slot] = act
+        self.rew_buf[slot] = rew
+        self.irew_buf[slot] = irew
+        self.wrew_buf[slot] = wrew
+        self.done_buf[slot] = done
+
+    def _stack(self, newest, start):
+        # frames newest-k+1 ... newest, clamped to the episode's reset frame
+        offsets = np.arange(self.frame_stack - 1, -1, -1)
+        idxs = np.maximum(newest[:, None] - offsets, start[:, None]) % self.max_size
+        frames = self.frame_buf[idxs]
+        return frames.reshape((len(newest), -1) + self.frame_shape[1:])
+
+    def sample_batch(self, batch_size=32):
+        # once full, the oldest frame_stack slots may have lost their history
+        lo = self.frame_stack if self.size == self.max_size else 0
+        oldest = self.ptr - self.size
+        idxs = (oldest + np.random.randint(lo, self.size, size=batch_size)) % self.max_size
+        invalid = ~self.valid_buf[idxs]
+        while invalid.any():
+            redraw = np.random.randint(lo, self.size, size=invalid.sum())
+            idxs[invalid] = (oldest + redraw) % self.max_size
+            invalid = ~self.valid_buf[idxs]
+
+        newest, start = self.abs_buf[idxs], self.start_buf[idxs]
+        batch = dict(
+            sk=self.sk_buf[idxs],
+            obs=self._stack(newest - 1, start),
+            obs2=self._stack(newest, start),
+            act=self.act_buf[idxs],
+            rew=self.rew_buf[idxs],
+            irew=self.irew_buf[idxs],
+            wrew=self.wrew_buf[idxs],
+            done=self.done_buf[idxs],
+        )
+        return {k: torch.as_tensor(v, dtype=torch.float32) for k, v in batch.items()}
+
+    def state_dict(self):
+        """The stored frames and transitions and write position, for checkpointing."""
+        state = {k: v[: self.size] for k, v in vars(self).items() if k.endswith("_buf")}
+        state.update(ptr=self.ptr, size=self.size, total=self.total, ep_start=self.ep_start)
+        return state
+
+    def load_state_dict(self, state):
+        for k, v in state.items():
+            if k.endswith("_buf"):
+                getattr(self, k)[: len(v)] = v
+        self.ptr, self.size = state["ptr"], state["size"]
+        self.total, self.ep_start = state["total"], state["ep_start"]
+
 
 def diayn(
     env_fn,
@@ -76,10 +233,16 @@ def diayn(
     start_steps=10000,
     update_after=1000,
     update_every=50,
+    updates_per_step=1,
     num_test_episodes=10,
     max_ep_len=1000,
     logger_kwargs=dict(),
     save_freq=1,
+    checkpoint_freq=10,
+    resume=None,
+    checkpoint_kwargs=dict(),
+    data_parallel=False,
+    frame_stack=None,
 ):
     """
 
@@ -167,7 +330,10 @@ def diayn(
         update_every (int): Number of env interactions that should elapse
             between gradient descent updates. Note: Regardless of how long
             you wait between updates, the ratio of env steps to gradient steps
-            is locked to 1.
+            is locked to ``updates_per_step``.
+
+        updates_per_step (int): Number of gradient steps per env
+            interaction (the update-to-data ratio).
 
         num_test_episodes (int): Number of episodes to test the deterministic
             policy at the end of each epoch.
@@ -179,11 +345,61 @@ def diayn(
         save_freq (int): How often (in terms of gap between epochs) to save
             the current policy and value function.
 
+        checkpoint_freq (int): How often (in terms of gap between epochs) to
+            checkpoint the full training state, replay buffer and optimizers
+            included. The last epoch is always checkpointed.
+
+        resume (str or bool): Continue training from the newest full
+            training-state checkpoint of the run in this directory (if
+            ``True``, the run's own output directory). The run goes on
+            exactly as if it had never stopped, provided the envs support
+            ``get_state``/``set_state``; otherwise they start new episodes.
+
+        checkpoint_kwargs (dict): Keyword args for CheckpointWriter, e.g.
+            ``keep_last`` and ``keep_every`` to choose which checkpoints
+            are kept on disk.
+
+        data_parallel (bool): Under MPI, make every process a learner too
+            (see below). Each minibatch of ``batch_size`` is then split
+            between the processes, which average their gradients, so
+            larger batches cost little more time per update.
+
+        frame_stack (int): Set for pixel observations which are stacks of
+            this many channels-first uint8 frames, as made by
+            ``dmc2gym.make(from_pixels=True, frame_stack=k)`` (use with an
+            image actor-critic like ``core.CNNActorCritic``). Transitions
+            then go to a ``FrameStackReplayBuffer``, which keeps every frame
+            once instead of two float32 stacks per transition. Only for a
+            single process.
+
+    Run under MPI (e.g. ``mpi_fork``), every process collects an equal
+    share of the env interactions with its own envs and skills: the actors.
+    Every ``update_every`` interactions (in total), their new transitions
+    are gathered into the replay buffer of process 0, the learner, which
+    runs the gradient steps and broadcasts the new weights back. Steps
+    counts (``steps_per_epoch``, ``start_steps``, ``update_after``,
+    ``update_every``) are totals over all processes, so one epoch still
+    takes ``steps_per_epoch`` env interactions (which must divide evenly
+    between the processes) and ``updates_per_step`` gradient steps per
+    interaction. Only the learner has a replay buffer and only its state
+    is checkpointed: on resume, the other processes start new episodes.
+
+    With ``data_parallel``, the transitions are gathered on every process
+    instead, into identical replay buffers. Each process samples its share
+    of every minibatch, and the gradients of Q, pi and the discriminator
+    are averaged across processes before each step (as in ``ppo``), so all
+    copies of the networks stay the same without any broadcast.
+
     """
 
-    logger = EpochLogger(**logger_kwargs)
+    # Special function to avoid certain slowdowns from PyTorch + MPI combo.
+    setup_pytorch_for_mpi()
+
+    logger = EpochLogger(resume=bool(resume), **logger_kwargs)
     logger.save_config(locals())
 
+    # Random seed
+    seed += 10000 * proc_id()
     torch.manual_seed(seed)
     np.random.seed(seed)
 
@@ -196,6 +412,9 @@ def diayn(
 
     # Create actor-critic module and target networks
     ac = actor_critic(n_skill, env.observation_space, env.action_space, **ac_kwargs)
+
+    # Sync params across processes
+    sync_params(ac)
     ac_targ = deepcopy(ac)
 
     # Helper function to get a one-hot encoded skill vector
@@ -208,8 +427,29 @@ def diayn(
     # List of parameters for both Q-networks (save this for convenience)
     q_params = itertools.chain(ac.q1.parameters(), ac.q2.parameters())
 
-    # Experience buffer
-    replay_buffer = ReplayBuffer(sk_dim=n_skill, obs_dim=obs_dim, act_dim=act_dim, size=replay_size)
+    # With MPI, every process takes an equal share of the env interactions
+    n_procs = num_procs()
+    assert steps_per_epoch % n_procs == 0, (
+        "steps_per_epoch (%d) must be a multiple of the number of processes (%d)"
+        % (steps_per_epoch, n_procs))
+    assert frame_stack is None or n_procs == 1, "frame_stack needs a single process"
+    is_learner = proc_id() == 0 or data_parallel
+    local_steps_per_epoch = steps_per_epoch // n_procs
+    local_start_steps = start_steps // n_procs
+    local_update_after = update_after // n_procs
+    local_update_every = max(update_every // n_procs, 1)
+    local_test_episodes = max(num_test_episodes // n_procs, 1)
+    local_batch_size = max(batch_size // n_procs, 1) if data_parallel else batch_size
+
+    # Experience buffer (only on the learner(s), filled from each process's
+    # outbox of transitions collected since the last update)
+    replay_buffer = None
+    if frame_stack is not None:
+        replay_buffer = FrameStackReplayBuffer(
+            sk_dim=n_skill, obs_dim=obs_dim, act_dim=act_dim, size=replay_size, frame_stack=frame_stack)
+    elif is_learner:
+        replay_buffer = ReplayBuffer(sk_dim=n_skill, obs_dim=obs_dim, act_dim=act_dim, size=replay_size)
+    outbox = ReplayBuffer(sk_dim=n_skill, obs_dim=obs_dim, act_dim=act_dim, size=local_update_every)
 
     # Count variables (protip: try to get a feel for how different size networks behave!)
     var_counts = tuple(core.count_vars(module) for module in [ac.pi, ac.q1, ac.q2])
@@ -223,7 +463,7 @@ def diayn(
     assert 0 <= intrinsic_max <= 10, f"Intrinsic max must be 0...10, got {intrinsic_max}"
 
     def get_discriminator_confidence(s, o):
-        assert len(s.shape) == len(o.shape) == 1, "Function can't handle batches"
+        assert len(s.shape) == 1 and o.shape == obs_dim, "Function can't handle batches"
 
         # Convert to tensors
         s = torch.as_tensor(s, dtype=torch.float32)
@@ -337,19 +577,25 @@ def diayn(
 
         return loss_d, d_info
         
+    # Both Q-networks, to average their gradients in one go
+    q_nets = torch.nn.ModuleList([ac.q1, ac.q2])
+
     # Set up optimizers for policy and q-function
     di_optimizer = Adam(ac.di.parameters(), lr=lr)
     pi_optimizer = Adam(ac.pi.parameters(), lr=lr)
     q_optimizer = Adam(q_params, lr=lr)
 
     # Set up model saving
-    logger.setup_pytorch_saver(ac)
+    logger.setup_pytorch_saver(ac, pytorch_model_spec(
+        actor_critic, env.observation_space, env.action_space, ac_kwargs, n_skill))
 
     def update(data):
         # First run one gradient descent step for Q1 and Q2
         q_optimizer.zero_grad()
         loss_q, q_info = compute_loss_q(data)
         loss_q.backward()
+        if data_parallel:
+            mpi_avg_grads(q_nets)
         q_optimizer.step()
 
         # Record things
@@ -364,12 +610,16 @@ def diayn(
         pi_optimizer.zero_grad()
         loss_pi, pi_info = compute_loss_pi(data)
         loss_pi.backward()
+        if data_parallel:
+            mpi_avg_grads(ac.pi)
         pi_optimizer.step()
         
         # Next run on gradient descent step for the discriminator
         di_optimizer.zero_grad()
         loss_di, di_info = compute_loss_d(data)
         loss_di.backward()
+        if data_parallel:
+            mpi_avg_grads(ac.di)
         di_optimizer.step()
 
         # Unfreeze Q-networks so you can optimize it at next DDPG step.
@@ -396,7 +646,7 @@ def diayn(
         )
 
     def test_agent():
-        for j in range(num_test_episodes):
+        for j in range(local_test_episodes):
             sk, o, d, ep_ret, ep_iret, ep_wret, ep_len = g_sk(n_skill), test_env.reset(), False, 0, 0, 0, 0
             while not (d or (ep_len == max_ep_len)):
                 # Take deterministic actions at test time
@@ -409,18 +659,65 @@ def diayn(
                 ep_len += 1
             logger.store(
                 TestEpIRet=ep_iret, TestEpWRet=ep_wret, TestEpRet=ep_ret, TestEpLen=ep_len)
+            test_ep_skills.append(sk.argmax())
 
     # Prepare for interaction with environment
-    total_steps = steps_per_epoch * epochs
+    total_steps = local_steps_per_epoch * epochs
     start_time = time.time()
     sk, o, ep_ret, ep_iret, ep_wret, ep_len = g_sk(n_skill), env.reset(), 0, 0, 0, 0
+    start_epoch = 0
+
+    # Skill of each episode logged this epoch, for the per-skill diagnostics
+    ep_skills, test_ep_skills = [], []
+
+    # Pick up where the last checkpoint left off. Every process that
+    # updates the networks (just the learner, unless data_parallel) loads
+    # them, process 0 also gets back its envs and RNGs.
+    if resume:
+        fname = None
+        if proc_id() == 0:
+            fname = latest_checkpoint(logger.output_dir if resume is True else resume)
+            if fname is None:
+                logger.log("No checkpoint to resume from, starting from scratch.", color="red")
+            else:
+                logger.log("Resuming from %s" % fname)
+        if n_procs > 1:
+            fname = broadcast_object(fname)
+        if fname is not None and is_learner:
+            state = load_checkpoint(fname)
+            ac.load_state_dict(state["ac"])
+            ac_targ.load_state_dict(state["ac_targ"])
+            pi_optimizer.load_state_dict(state["pi_optimizer"])
+            q_optimizer.load_state_dict(state["q_optimizer"])
+            di_optimizer.load_state_dict(state["di_optimizer"])
+            replay_buffer.load_state_dict(state["replay_buffer"])
+            if proc_id() == 0:
+                set_rng_state(state["rng"])
+                if state["env"] is not None and state["test_env"] is not None:
+                    set_env_state(env, state["env"])
+                    set_env_state(test_env, state["test_env"])
+                    sk, o, ep_ret, ep_iret, ep_wret, ep_len = state["episode"]
+                else:
+                    logger.log("Env state was not saved, starting a new episode.", color="red")
+            start_epoch = state["epoch"]
+            start_time -= state["time"]
+            del state
+        logger.restore_progress(start_epoch)
+        if n_procs > 1 and not data_parallel:
+            # The actors only need the learner's counters and weights
+            counters = np.array([start_epoch, start_time], dtype=np.float64)
+            broadcast(counters)
+            start_epoch, start_time = int(counters[0]), counters[1]
+            sync_params(ac)
+            sync_params(ac_targ)
+    checkpointer = CheckpointWriter(logger.output_dir, **checkpoint_kwargs) if proc_id() == 0 else None
 
     # Main loop: collect experience in env and update/log each epoch
-    for t in range(total_steps):
+    for t in range(start_epoch * local_steps_per_epoch, total_steps):
         # Until start_steps have elapsed, randomly sample actions
         # from a uniform distribution for better exploration. Afterwards,
         # use the learned policy.
-        if t > start_steps:
+        if t > local_start_steps:
             a = get_action(sk, o)
         else:
             a = env.action_space.sample()
@@ -440,8 +737,8 @@ def diayn(
         # that isn't based on the agent's state)
         d = False if ep_len == max_ep_len else d
 
-        # Store experience to replay buffer
-        replay_buffer.store(sk, o, a, r, dc, wr, o2, d)
+        # Store experience to replay buffer (with MPI, to the outbox)
+        (replay_buffer if n_procs == 1 else outbox).store(sk, o, a, r, dc, wr, o2, d, first=ep_len == 1)
 
         # Super critical, easy to overlook step: make sure to update
         # most recent observation!
@@ -450,17 +747,29 @@ def diayn(
         # End of trajectory handling
         if d or (ep_len == max_ep_len):
             logger.store(EpIRet=ep_iret, EpWRet=ep_wret, EpRet=ep_ret, EpLen=ep_len)
+            ep_skills.append(sk.argmax())
             sk, o, ep_ret, ep_iret, ep_wret, ep_len = g_sk(n_skill), env.reset(), 0, 0, 0, 0
 
         # Update handling
-        if t >= update_after and t % update_every == 0:
-            for j in range(update_every):
-                batch = replay_buffer.sample_batch(batch_size)
-                update(data=batch)
+        if t % local_update_every == 0:
+            if n_procs > 1:
+                # Send every actor's new transitions to the learner(s)
+                rows = (allgather if data_parallel else gather)(outbox.packed())
+                outbox.clear()
+                if rows is not None:
+                    replay_buffer.store_packed(rows.reshape(-1, rows.shape[-1]))
+            if t >= local_update_after:
+                if is_learner:
+                    for j in range(local_update_every * n_procs * updates_per_step):
+                        batch = replay_buffer.sample_batch(local_batch_size)
+                        update(data=batch)
+                if not data_parallel:
+                    sync_params(ac)
+                    sync_params(ac_targ)
 
         # End of epoch handling
-        if (t + 1) % steps_per_epoch == 0:
-            epoch = (t + 1) // steps_per_epoch
+        if (t + 1) % local_steps_per_epoch == 0:
+            epoch = (t + 1) // local_steps_per_epoch
 
             # Save model
             if (epoch % save_freq == 0) or (epoch == epochs):
@@ -471,6 +780,11 @@ def diayn(
 
             # Log info about epoch
             logger.log_tabular("Epoch", epoch)
+            for key, skills in [("EpRet", ep_skills), ("EpIRet", ep_skills),
+                                ("TestEpRet", test_ep_skills), ("TestEpIRet", test_ep_skills)]:
+                logger.log_tabular(key + "PerSkill", logger.get_group_means(key, skills, n_skill))
+            ep_skills.clear()
+            test_ep_skills.clear()
             logger.log_tabular("EpRet", average_only=True)
             logger.log_tabular("EpIRet", average_only=True)
             logger.log_tabular("EpWRet", with_min_and_max=True)
@@ -479,7 +793,7 @@ def diayn(
             logger.log_tabular("TestEpWRet", with_min_and_max=True)
             logger.log_tabular("EpLen", average_only=True)
             logger.log_tabular("TestEpLen", average_only=True)
-            logger.log_tabular("TotalEnvInteracts", t)
+            logger.log_tabular("TotalEnvInteracts", t * n_procs)
             logger.log_tabular("Q1Vals", with_min_and_max=True)
             logger.log_tabular("Q2Vals", with_min_and_max=True)
             logger.log_tabular("DiVals", average_only=True)
@@ -491,6 +805,30 @@ def diayn(
             logger.log_tabular("Time", time.time() - start_time)
             logger.dump_tabular()
 
+            # Checkpoint the full training state, written in the background
+            if checkpointer is not None and ((epoch % checkpoint_freq == 0) or (epoch == epochs)):
+                checkpointer.save(
+                    dict(
+                        epoch=epoch,
+                        time=time.time() - start_time,
+                        ac=ac.state_dict(),
+                        ac_targ=ac_targ.state_dict(),
+                        pi_optimizer=pi_optimizer.state_dict(),
+                        q_optimizer=q_optimizer.state_dict(),
+                        di_optimizer=di_optimizer.state_dict(),
+                        replay_buffer=replay_buffer.state_dict(),
+                        rng=get_rng_state(),
+                        env=get_env_state(env),
+                        test_env=get_env_state(test_env),
+                        episode=(sk, o, ep_ret, ep_iret, ep_wret, ep_len),
+                    ),
+                    epoch,
+                )
+
+    if checkpointer is not None:
+        checkpointer.close()
+    logger.wait_saves()
+
 
 if __name__ == "__main__":
     import argparse
@@ -44,6 +44,32 @@ def discount_cumsum(x, discount):
     return scipy.signal.lfilter([1], [1, float(-discount)], x[::-1], axis=0)[::-1]
 
 
+def discount_cumsum_paths(x, discount, path_ends):
+    """
+    discount_cumsum of many paths at once, without a loop over them.
+
+    input:
+        x, shape (num_envs, T): each row holds the paths of one env, one
+            after the other.
+        path_ends, same shape: True at the last step of every path.
+
+    output:
+        for each step, the discounted sum of x from that step to the end
+        of its path.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    T = x.shape[-1]
+    # discounted sums to the end of each row, running across path ends
+    y = scipy.signal.lfilter([1], [1, float(-discount)], x[..., ::-1], axis=-1)[..., ::-1]
+    # index of the last step of each step's path (T past the last path end)
+    steps = np.arange(T)
+    end = np.minimum.accumulate(np.where(path_ends, steps, T)[..., ::-1], axis=-1)[..., ::-1]
+    # take out what the following paths added to each sum
+    nxt = np.minimum(end + 1, T)
+    y_next = np.take_along_axis(np.append(y, np.zeros_like(y[..., :1]), axis=-1), nxt, axis=-1)
+    return y - discount ** (nxt - steps) * y_next
+
+
 class Actor(nn.Module):
 
     def _distribution(self, obs):
@@ -14,39 +14,46 @@ class PPOBuffer:
     A buffer for storing trajectories experienced by a PPO agent interacting
     with the environment, and using Generalized Advantage Estimation (GAE-Lambda)
     for calculating the advantages of state-action pairs.
+
+    Steps are laid out as (num_envs, T), one row per copy of the
+    environment, so a vectorized env can store all of its copies' steps at
+    once. Advantages and rewards-to-go are computed for every trajectory in
+    a single batched pass, when the data is taken out with ``get``.
     """
 
-    def __init__(self, obs_dim, act_dim, size, gamma=0.99, lam=0.95):
-        self.obs_buf = np.zeros(core.combined_shape(size, obs_dim), dtype=np.float32)
-        self.act_buf = np.zeros(core.combined_shape(size, act_dim), dtype=np.float32)
-        self.adv_buf = np.zeros(size, dtype=np.float32)
-        self.rew_buf = np.zeros(size, dtype=np.float32)
-        self.ret_buf = np.zeros(size, dtype=np.float32)
-        self.val_buf = np.zeros(size, dtype=np.float32)
-        self.logp_buf = np.zeros(size, dtype=np.float32)
+    def __init__(self, obs_dim, act_dim, size, gamma=0.99, lam=0.95, num_envs=1):
+        assert size % num_envs == 0     # every env gets the same number of steps
+        T = size // num_envs
+        self.obs_buf = np.zeros((num_envs, *core.combined_shape(T, obs_dim)), dtype=np.float32)
+        self.act_buf = np.zeros((num_envs, *core.combined_shape(T, act_dim)), dtype=np.float32)
+        self.rew_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.val_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.logp_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.end_buf = np.zeros((num_envs, T), dtype=bool)
+        self.last_val_buf = np.zeros((num_envs, T), dtype=np.float32)
         self.gamma, self.lam = gamma, lam
-        self.ptr, self.path_start_idx, self.max_size = 0, 0, size
+        self.ptr, self.max_size = 0, T
 
     def store(self, obs, act, rew, val, logp):
         """
-        Append one timestep of agent-environment interaction to the buffer.
+        Append one timestep of agent-environment interaction to the buffer:
+        one value per env (or just the value, with a single env).
         """
         assert self.ptr < self.max_size     # buffer has to have room so you can store
-        self.obs_buf[self.ptr] = obs
-        self.act_buf[self.ptr] = act
-        self.rew_buf[self.ptr] = rew
-        self.val_buf[self.ptr] = val
-        self.logp_buf[self.ptr] = logp
+        self.obs_buf[:, self.ptr] = obs
+        self.act_buf[:, self.ptr] = act
+        self.rew_buf[:, self.ptr] = rew
+        self.val_buf[:, self.ptr] = val
+        self.logp_buf[:, self.ptr] = logp
         self.ptr += 1
 
-    def finish_path(self, last_val=0):
+    def finish_path(self, last_val=0, env=None):
         """
         Call this at the end of a trajectory, or when one gets cut off
-        by an epoch ending. This looks back in the buffer to where the
-        trajectory started, and uses rewards and value estimates from
-        the whole trajectory to compute advantage estimates with GAE-Lambda,
-        as well as compute the rewards-to-go for each state, to use as
-        the targets for the value function.
+        by an epoch ending. This marks the last stored step of env ``env``
+        (of every env, if None) as the end of its trajectory; advantage
+        estimates with GAE-Lambda and rewards-to-go, the targets for the
+        value function, are computed from it in ``get``.
 
         The "last_val" argument should be 0 if the trajectory ended
         because the agent reached a terminal state (died), and otherwise
@@ -54,19 +61,9 @@ class PPOBuffer:
         This allows us to bootstrap the reward-to-go calculation to account
         for timesteps beyond the arbitrary episode horizon (or epoch cutoff).
         """
-
-        path_slice = slice(self.path_start_idx, self.ptr)
-        rews = np.append(self.rew_buf[path_slice], last_val)
-        vals = np.append(self.val_buf[path_slice], last_val)
-        
-        # the next two lines implement GAE-Lambda advantage calculation
-        deltas = rews[:-1] + self.gamma * vals[1:] - vals[:-1]
-        self.adv_buf[path_slice] = core.discount_cumsum(deltas, self.gamma * self.lam)
-        
-        # the next line computes rewards-to-go, to be targets for the value function
-        self.ret_buf[path_slice] = core.discount_cumsum(rews, self.gamma)[:-1]
-        
-        self.path_start_idx = self.ptr
+        envs = slice(None) if env is None else env
+        self.end_buf[envs, self.ptr - 1] = True
+        self.last_val_buf[envs, self.ptr - 1] = last_val
 
     def get(self):
         """
@@ -75,20 +72,37 @@ class PPOBuffer:
         mean zero and std one). Also, resets some pointers in the buffer.
         """
         assert self.ptr == self.max_size    # buffer has to be full before you can get
-        self.ptr, self.path_start_idx = 0, 0
+        assert self.end_buf[:, -1].all()    # and every trajectory finished
+        ends = self.end_buf
+        rews, vals, last_vals = self.rew_buf, self.val_buf, self.last_val_buf
+
+        # the next three lines implement GAE-Lambda advantage calculation,
+        # over every trajectory at once
+        next_vals = np.where(ends, last_vals, np.roll(vals, -1, axis=1))
+        deltas = rews + self.gamma * next_vals - vals
+        adv = core.discount_cumsum_paths(deltas, self.gamma * self.lam, ends)
+
+        # the next line computes rewards-to-go, to be targets for the value function
+        ret = core.discount_cumsum_paths(np.where(ends, rews + self.gamma * last_vals, rews),
+                                         self.gamma, ends)
+
+        self.ptr = 0
+        self.end_buf[:] = False
         # the next two lines implement the advantage normalization trick
-        adv_mean, adv_std = mpi_statistics_scalar(self.adv_buf)
-        self.adv_buf = (self.adv_buf - adv_mean) / adv_std
-        data = dict(obs=self.obs_buf, act=self.act_buf, ret=self.ret_buf,
-                    adv=self.adv_buf, logp=self.logp_buf)
-        return {k: torch.as_tensor(v, dtype=torch.float32) for k,v in data.items()}
+        adv_mean, adv_std = mpi_statistics_scalar(adv)
+        adv = (adv - adv_mean) / adv_std
+        data = dict(obs=self.obs_buf, act=self.act_buf, ret=ret, adv=adv, logp=self.logp_buf)
+        # one row per step, env by env
+        return {k: torch.as_tensor(v.reshape(-1, *v.shape[2:]), dtype=torch.float32)
+                for k,v in data.items()}
 
 
 
 def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0, 
         steps_per_epoch=4000, epochs=50, gamma=0.99, clip_ratio=0.2, pi_lr=3e-4,
         vf_lr=1e-3, train_pi_iters=80, train_v_iters=80, lam=0.97, max_ep_len=1000,
-        target_kl=0.01, logger_kwargs=dict(), save_freq=10):
+        target_kl=0.01, logger_kwargs=dict(), save_freq=10, minibatch_size=None,
+        train_epochs=10):
     """
     Proximal Policy Optimization (by clipping), 
 
@@ -190,6 +204,16 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         save_freq (int): How often (in terms of gap between epochs) to save
             the current policy and value function.
 
+        minibatch_size (int): If given, train on shuffled minibatches of
+            this many samples (in total over all MPI processes) instead of
+            the whole epoch's data: ``train_epochs`` passes over the data
+            for the policy and for the value function. ``train_pi_iters``
+            and ``train_v_iters`` are then unused. Early stopping checks the
+            KL on each minibatch before stepping on it.
+
+        train_epochs (int): Number of passes over the data per epoch, with
+            ``minibatch_size``.
+
     """
 
     # Special function to avoid certain slowdowns from PyTorch + MPI combo.
@@ -222,6 +246,8 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     # Set up experience buffer
     local_steps_per_epoch = int(steps_per_epoch / num_procs())
     buf = PPOBuffer(obs_dim, act_dim, local_steps_per_epoch, gamma, lam)
+    if minibatch_size is not None:
+        local_minibatch_size = max(minibatch_size // num_procs(), 1)
 
     # Set up function for computing PPO policy loss
     def compute_loss_pi(data):
@@ -254,6 +280,19 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     # Set up model saving
     logger.setup_pytorch_saver(ac)
 
+    def batches(data, iters):
+        """
+        The data for each gradient descent step: all of it, ``iters`` times,
+        or shuffled minibatches for ``train_epochs`` passes over it.
+        """
+        if minibatch_size is None:
+            for _ in range(iters):
+                yield data
+        else:
+            for _ in range(train_epochs):
+                for idxs in torch.randperm(len(data['obs'])).split(local_minibatch_size):
+                    yield {k: v[idxs] for k,v in data.items()}
+
     def update():
         data = buf.get()
 
@@ -262,9 +301,9 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         v_l_old = compute_loss_v(data).item()
 
         # Train policy with multiple steps of gradient descent
-        for i in range(train_pi_iters):
+        for i, batch in enumerate(batches(data, train_pi_iters)):
             pi_optimizer.zero_grad()
-            loss_pi, pi_info = compute_loss_pi(data)
+            loss_pi, pi_info = compute_loss_pi(batch)
             kl = mpi_avg(pi_info['kl'])
             if kl > 1.5 * target_kl:
                 logger.log('Early stopping at step %d due to reaching max kl.'%i)
@@ -276,13 +315,19 @@ def ppo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         logger.store(StopIter=i)
 
         # Value function learning
-        for i in range(train_v_iters):
+        for batch in batches(data, train_v_iters):
             vf_optimizer.zero_grad()
-            loss_v = compute_loss_v(data)
+            loss_v = compute_loss_v(batch)
             loss_v.backward()
             mpi_avg_grads(ac.v)    # average grads across MPI processes
             vf_optimizer.step()
 
+        if minibatch_size is not None:
+            # Log changes in the losses over all of the data, not the last minibatch
+            with torch.no_grad():
+                loss_pi, pi_info = compute_loss_pi(data)
+                loss_v = compute_loss_v(data)
+
         # Log changes from update
         kl, ent, cf = pi_info['kl'], pi_info_old['ent'], pi_info['cf']
         logger.store(LossPi=pi_l_old, LossV=v_l_old,
@@ -365,6 +410,8 @@ if __name__ == '__main__':
     parser.add_argument('--steps', type=int, default=4000)
     parser.add_argument('--epochs', type=int, default=50)
     parser.add_argument('--exp_name', type=str, default='ppo')
+    parser.add_argument('--minibatch_size', type=int, default=None)
+    parser.add_argument('--train_epochs', type=int, default=10)
     args = parser.parse_args()
 
     mpi_fork(args.cpu)  # run parallel code with mpi
@@ -375,4 +422,5 @@ if __name__ == '__main__':
     ppo(lambda : gym.make(args.env), actor_critic=core.MLPActorCritic,
         ac_kwargs=dict(hidden_sizes=[args.hid]*args.l), gamma=args.gamma, 
         seed=args.seed, steps_per_epoch=args.steps, epochs=args.epochs,
-        logger_kwargs=logger_kwargs)
\ No newline at end of file
+        logger_kwargs=logger_kwargs, minibatch_size=args.minibatch_size,
+        train_epochs=args.train_epochs)
\ No newline at end of file
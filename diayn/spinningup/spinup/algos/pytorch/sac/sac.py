@@ -6,7 +6,10 @@ from torch.optim import Adam
 import gym
 import time
 import diayn.spinningup.spinup.algos.pytorch.sac.core as core
-from diayn.spinningup.spinup.utils.logx import EpochLogger
+from diayn.spinningup.spinup.utils.logx import EpochLogger, pytorch_model_spec
+from diayn.spinningup.spinup.utils.checkpoint import (
+    CheckpointWriter, get_env_state, get_rng_state, latest_checkpoint,
+    load_checkpoint, set_env_state, set_rng_state)
 
 
 class ReplayBuffer:
@@ -40,13 +43,26 @@ class ReplayBuffer:
                      done=self.done_buf[idxs])
         return {k: torch.as_tensor(v, dtype=torch.float32) for k,v in batch.items()}
 
+    def state_dict(self):
+        """The stored transitions and write position, for checkpointing."""
+        state = {k: v[:self.size] for k, v in vars(self).items() if k.endswith('_buf')}
+        state.update(ptr=self.ptr, size=self.size)
+        return state
+
+    def load_state_dict(self, state):
+        for k, v in state.items():
+            if k.endswith('_buf'):
+                getattr(self, k)[:len(v)] = v
+        self.ptr, self.size = state['ptr'], state['size']
+
 
 
 def sac(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0, 
         steps_per_epoch=4000, epochs=100, replay_size=int(1e6), gamma=0.99, 
         polyak=0.995, lr=1e-3, alpha=0.2, batch_size=100, start_steps=10000, 
         update_after=1000, update_every=50, num_test_episodes=10, max_ep_len=1000, 
-        logger_kwargs=dict(), save_freq=1):
+        logger_kwargs=dict(), save_freq=1, checkpoint_freq=10, resume=None,
+        checkpoint_kwargs=dict()):
     """
     Soft Actor-Critic (SAC)
 
@@ -142,9 +158,23 @@ def sac(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
         save_freq (int): How often (in terms of gap between epochs) to save
             the current policy and value function.
 
+        checkpoint_freq (int): How often (in terms of gap between epochs) to
+            checkpoint the full training state, replay buffer and optimizers
+            included. The last epoch is always checkpointed.
+
+        resume (str or bool): Continue training from the newest full
+            training-state checkpoint of the run in this directory (if
+            ``True``, the run's own output directory). The run goes on
+            exactly as if it had never stopped, provided the envs support
+            ``get_state``/``set_state``; otherwise they start new episodes.
+
+        checkpoint_kwargs (dict): Keyword args for CheckpointWriter, e.g.
+            ``keep_last`` and ``keep_every`` to choose which checkpoints
+            are kept on disk.
+
     """
 
-    logger = EpochLogger(**logger_kwargs)
+    logger = EpochLogger(resume=bool(resume), **logger_kwargs)
     logger.save_config(locals())
 
     torch.manual_seed(seed)
@@ -225,7 +255,8 @@ def sac(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     q_optimizer = Adam(q_params, lr=lr)
 
     # Set up model saving
-    logger.setup_pytorch_saver(ac)
+    logger.setup_pytorch_saver(ac, pytorch_model_spec(
+        actor_critic, env.observation_space, env.action_space, ac_kwargs))
 
     def update(data):
         # First run one gradient descent step for Q1 and Q2
@@ -281,9 +312,36 @@ def sac(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
     total_steps = steps_per_epoch * epochs
     start_time = time.time()
     o, ep_ret, ep_len = env.reset(), 0, 0
+    start_epoch = 0
+
+    # Pick up where the last checkpoint left off
+    if resume:
+        fname = latest_checkpoint(logger.output_dir if resume is True else resume)
+        if fname is None:
+            logger.log('No checkpoint to resume from, starting from scratch.', color='red')
+        else:
+            logger.log('Resuming from %s'%fname)
+            state = load_checkpoint(fname)
+            ac.load_state_dict(state['ac'])
+            ac_targ.load_state_dict(state['ac_targ'])
+            pi_optimizer.load_state_dict(state['pi_optimizer'])
+            q_optimizer.load_state_dict(state['q_optimizer'])
+            replay_buffer.load_state_dict(state['replay_buffer'])
+            set_rng_state(state['rng'])
+            if state['env'] is not None and state['test_env'] is not None:
+                set_env_state(env, state['env'])
+                set_env_state(test_env, state['test_env'])
+                o, ep_ret, ep_len = state['episode']
+            else:
+                logger.log('Env state was not saved, starting a new episode.', color='red')
+            start_epoch = state['epoch']
+            start_time -= state['time']
+            del state
+        logger.restore_progress(start_epoch)
+    checkpointer = CheckpointWriter(logger.output_dir, **checkpoint_kwargs)
 
     # Main loop: collect experience in env and update/log each epoch
-    for t in range(total_steps):
+    for t in range(start_epoch*steps_per_epoch, total_steps):
         
         # Until start_steps have elapsed, randomly sample actions
         # from a uniform distribution for better exploration. Afterwards, 
@@ -347,6 +405,23 @@ def sac(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0,
             logger.log_tabular('Time', time.time()-start_time)
             logger.dump_tabular()
 
+            # Checkpoint the full training state, written in the background
+            if (epoch % checkpoint_freq == 0) or (epoch == epochs):
+                checkpointer.save(dict(epoch=epoch,
+                                       time=time.time()-start_time,
+                                       ac=ac.state_dict(),
+                                       ac_targ=ac_targ.state_dict(),
+                                       pi_optimizer=pi_optimizer.state_dict(),
+                                       q_optimizer=q_optimizer.state_dict(),
+                                       replay_buffer=replay_buffer.state_dict(),
+                                       rng=get_rng_state(),
+                                       env=get_env_state(env),
+                                       test_env=get_env_state(test_env),
+                                       episode=(o, ep_ret, ep_len)), epoch)
+
+    checkpointer.close()
+    logger.wait_saves()
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
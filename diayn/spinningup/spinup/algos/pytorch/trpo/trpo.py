@@ -1,4 +1,461 @@
-def trpo(*args, **kwargs):
-    print('\n\nUnfortunately, TRPO has not yet been implemented in PyTorch '\
-        + 'for Spinning Up. TRPO will migrate some time in the future.\n\n')
-    raise NotImplementedError
\ No newline at end of file
+import numpy as np
+import torch
+from torch.optim import Adam
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+import gym
+import time
+import spinup.algos.pytorch.trpo.core as core
+from spinup.utils.logx import EpochLogger
+from spinup.utils.mpi_pytorch import setup_pytorch_for_mpi, sync_params, mpi_avg_grads
+from spinup.utils.mpi_tools import mpi_fork, mpi_avg, proc_id, mpi_statistics_scalar, num_procs
+
+
+EPS = 1e-8
+
+class GAEBuffer:
+    """
+    A buffer for storing trajectories experienced by a TRPO agent interacting
+    with the environment, and using Generalized Advantage Estimation (GAE-Lambda)
+    for calculating the advantages of state-action pairs.
+
+    Steps are laid out as (num_envs, T), one row per copy of the
+    environment, so a vectorized env can store all of its copies' steps at
+    once. Advantages and rewards-to-go are computed for every trajectory in
+    a single batched pass, when the data is taken out with ``get``.
+    """
+
+    def __init__(self, obs_dim, act_dim, size, gamma=0.99, lam=0.95, num_envs=1):
+        assert size % num_envs == 0     # every env gets the same number of steps
+        T = size // num_envs
+        self.obs_buf = np.zeros((num_envs, *core.combined_shape(T, obs_dim)), dtype=np.float32)
+        self.act_buf = np.zeros((num_envs, *core.combined_shape(T, act_dim)), dtype=np.float32)
+        self.rew_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.val_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.logp_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.end_buf = np.zeros((num_envs, T), dtype=bool)
+        self.last_val_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.gamma, self.lam = gamma, lam
+        self.ptr, self.max_size = 0, T
+
+    def store(self, obs, act, rew, val, logp):
+        """
+        Append one timestep of agent-environment interaction to the buffer:
+        one value per env (or just the value, with a single env).
+        """
+        assert self.ptr < self.max_size     # buffer has to have room so you can store
+        self.obs_buf[:, self.ptr] = obs
+        self.act_buf[:, self.ptr] = act
+        self.rew_buf[:, self.ptr] = rew
+        self.val_buf[:, self.ptr] = val
+        self.logp_buf[:, self.ptr] = logp
+        self.ptr += 1
+
+    def finish_path(self, last_val=0, env=None):
+        """
+        Call this at the end of a trajectory, or when one gets cut off
+        by an epoch ending. This marks the last stored step of env ``env``
+        (of every env, if None) as the end of its trajectory; advantage
+        estimates with GAE-Lambda and rewards-to-go, the targets for the
+        value function, are computed from it in ``get``.
+
+        The "last_val" argument should be 0 if the trajectory ended
+        because the agent reached a terminal state (died), and otherwise
+        should be V(s_T), the value function estimated for the last state.
+        This allows us to bootstrap the reward-to-go calculation to account
+        for timesteps beyond the arbitrary episode horizon (or epoch cutoff).
+        """
+        envs = slice(None) if env is None else env
+        self.end_buf[envs, self.ptr - 1] = True
+        self.last_val_buf[envs, self.ptr - 1] = last_val
+
+    def get(self):
+        """
+        Call this at the end of an epoch to get all of the data from
+        the buffer, with advantages appropriately normalized (shifted to have
+        mean zero and std one). Also, resets some pointers in the buffer.
+        """
+        assert self.ptr == self.max_size    # buffer has to be full before you can get
+        assert self.end_buf[:, -1].all()    # and every trajectory finished
+        ends = self.end_buf
+        rews, vals, last_vals = self.rew_buf, self.val_buf, self.last_val_buf
+
+        # the next three lines implement GAE-Lambda advantage calculation,
+        # over every trajectory at once
+        next_vals = np.where(ends, last_vals, np.roll(vals, -1, axis=1))
+        deltas = rews + self.gamma * next_vals - vals
+        adv = core.discount_cumsum_paths(deltas, self.gamma * self.lam, ends)
+
+        # the next line computes rewards-to-go, to be targets for the value function
+        ret = core.discount_cumsum_paths(np.where(ends, rews + self.gamma * last_vals, rews),
+                                         self.gamma, ends)
+
+        self.ptr = 0
+        self.end_buf[:] = False
+        # the next two lines implement the advantage normalization trick
+        adv_mean, adv_std = mpi_statistics_scalar(adv)
+        adv = (adv - adv_mean) / adv_std
+        data = dict(obs=self.obs_buf, act=self.act_buf, ret=ret, adv=adv, logp=self.logp_buf)
+        # one row per step, env by env
+        return {k: torch.as_tensor(v.reshape(-1, *v.shape[2:]), dtype=torch.float32)
+                for k,v in data.items()}
+
+
+
+def trpo(env_fn, actor_critic=core.MLPActorCritic, ac_kwargs=dict(), seed=0, 
+         steps_per_epoch=4000, epochs=50, gamma=0.99, delta=0.01, vf_lr=1e-3,
+         train_v_iters=80, damping_coeff=0.1, cg_iters=10, backtrack_iters=10, 
+         backtrack_coeff=0.8, lam=0.97, max_ep_len=1000, logger_kwargs=dict(), 
+         save_freq=10, algo='trpo', hvp_subsample=0.2):
+    """
+    Trust Region Policy Optimization 
+
+    (with support for Natural Policy Gradient)
+
+    Args:
+        env_fn : A function which creates a copy of the environment.
+            The environment must satisfy the OpenAI Gym API.
+
+        actor_critic: The constructor method for a PyTorch Module with a 
+            ``step`` method, an ``act`` method, a ``pi`` module, and a ``v`` 
+            module. The ``step`` method should accept a batch of observations 
+            and return:
+
+            ===========  ================  ======================================
+            Symbol       Shape             Description
+            ===========  ================  ======================================
+            ``a``        (batch, act_dim)  | Numpy array of actions for each 
+                                           | observation.
+            ``v``        (batch,)          | Numpy array of value estimates
+                                           | for the provided observations.
+            ``logp_a``   (batch,)          | Numpy array of log probs for the
+                                           | actions in ``a``.
+            ===========  ================  ======================================
+
+            The ``act`` method behaves the same as ``step`` but only returns ``a``.
+
+            The ``pi`` module's forward call should accept a batch of 
+            observations and optionally a batch of actions, and return:
+
+            ===========  ================  ======================================
+            Symbol       Shape             Description
+            ===========  ================  ======================================
+            ``pi``       N/A               | Torch Distribution object, containing
+                                           | a batch of distributions describing
+                                           | the policy for the provided observations.
+            ``logp_a``   (batch,)          | Optional (only returned if batch of
+                                           | actions is given). Tensor containing 
+                                           | the log probability, according to 
+                                           | the policy, of the provided actions.
+                                           | If actions not given, will contain
+                                           | ``None``.
+            ===========  ================  ======================================
+
+            The ``v`` module's forward call should accept a batch of observations
+            and return:
+
+            ===========  ================  ======================================
+            Symbol       Shape             Description
+            ===========  ================  ======================================
+            ``v``        (batch,)          | Tensor containing the value estimates
+                                           | for the provided observations. (Critical: 
+                                           | make sure to flatten this!)
+            ===========  ================  ======================================
+
+
+        ac_kwargs (dict): Any kwargs appropriate for the ActorCritic object 
+            you provided to TRPO.
+
+        seed (int): Seed for random number generators.
+
+        steps_per_epoch (int): Number of steps of interaction (state-action pairs) 
+            for the agent and the environment in each epoch.
+
+        epochs (int): Number of epochs of interaction (equivalent to
+            number of policy updates) to perform.
+
+        gamma (float): Discount factor. (Always between 0 and 1.)
+
+        delta (float): KL-divergence limit for TRPO / NPG update. 
+            (Should be small for stability. Values like 0.01, 0.05.)
+
+        vf_lr (float): Learning rate for value function optimizer.
+
+        train_v_iters (int): Number of gradient descent steps to take on 
+            value function per epoch.
+
+        damping_coeff (float): Artifact for numerical stability, should be 
+            smallish. Adjusts Hessian-vector product calculation:
+            
+            .. math:: Hv \\rightarrow (\\alpha I + H)v
+
+            where :math:`\\alpha` is the damping coefficient. 
+            Probably don't play with this hyperparameter.
+
+        cg_iters (int): Number of iterations of conjugate gradient to perform. 
+            Increasing this will lead to a more accurate approximation
+            to :math:`H^{-1} g`, and possibly slightly-improved performance,
+            but at the cost of slowing things down. 
+
+            Also probably don't play with this hyperparameter.
+
+        backtrack_iters (int): Maximum number of steps allowed in the 
+            backtracking line search. Since the line search usually doesn't 
+            backtrack, and usually only steps back once when it does, this
+            hyperparameter doesn't often matter.
+
+        backtrack_coeff (float): How far back to step during backtracking line
+            search. (Always between 0 and 1, usually above 0.5.)
+
+        lam (float): Lambda for GAE-Lambda. (Always between 0 and 1,
+            close to 1.)
+
+        max_ep_len (int): Maximum length of trajectory / episode / rollout.
+
+        logger_kwargs (dict): Keyword args for EpochLogger.
+
+        save_freq (int): How often (in terms of gap between epochs) to save
+            the current policy and value function.
+
+        algo: Either 'trpo' or 'npg': this code supports both, since they are 
+            almost the same.
+
+        hvp_subsample (float): Fraction of the epoch's states on which the
+            KL's Hessian-vector products (used by conjugate gradient) are
+            computed. Smaller is cheaper and noisier; the policy gradient
+            and the line search always use all of the data.
+
+    """
+
+    # Special function to avoid certain slowdowns from PyTorch + MPI combo.
+    setup_pytorch_for_mpi()
+
+    # Set up logger and save configuration
+    logger = EpochLogger(**logger_kwargs)
+    logger.save_config(locals())
+
+    # Random seed
+    seed += 10000 * proc_id()
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+
+    # Instantiate environment
+    env = env_fn()
+    obs_dim = env.observation_space.shape
+    act_dim = env.action_space.shape
+
+    # Create actor-critic module
+    ac = actor_critic(env.observation_space, env.action_space, **ac_kwargs)
+    pi_params = list(ac.pi.parameters())
+
+    # Sync params across processes
+    sync_params(ac)
+
+    # Count variables
+    var_counts = tuple(core.count_vars(module) for module in [ac.pi, ac.v])
+    logger.log('\nNumber of parameters: \t pi: %d, \t v: %d\n'%var_counts)
+
+    # Set up experience buffer
+    local_steps_per_epoch = int(steps_per_epoch / num_procs())
+    buf = GAEBuffer(obs_dim, act_dim, local_steps_per_epoch, gamma, lam)
+
+    # Set up function for computing TRPO policy loss
+    def compute_loss_pi(data):
+        obs, act, adv, logp_old = data['obs'], data['act'], data['adv'], data['logp']
+        pi, logp = ac.pi(obs, act)
+        ratio = torch.exp(logp - logp_old)          # pi(a|s) / pi_old(a|s)
+        return -(ratio * adv).mean(), pi
+
+    # Set up function for computing value loss
+    def compute_loss_v(data):
+        obs, ret = data['obs'], data['ret']
+        return ((ac.v(obs) - ret)**2).mean()
+
+    # Set up optimizer for value function
+    vf_optimizer = Adam(ac.v.parameters(), lr=vf_lr)
+
+    # Set up model saving
+    logger.setup_pytorch_saver(ac)
+
+    def flat_avg_grad():
+        """The gradients of pi, averaged across MPI processes, as one vector."""
+        mpi_avg_grads(ac.pi)
+        return core.flat_concat([p.grad for p in pi_params])
+
+    def cg(Ax, b):
+        """
+        Conjugate gradient algorithm
+        (see https://en.wikipedia.org/wiki/Conjugate_gradient_method)
+        """
+        x = torch.zeros_like(b)
+        r = b.clone() # Note: should be 'b - Ax(x)', but for x=0, Ax(x)=0. Change if doing warm start.
+        p = r.clone()
+        r_dot_old = torch.dot(r,r)
+        for _ in range(cg_iters):
+            z = Ax(p)
+            alpha = r_dot_old / (torch.dot(p, z) + EPS)
+            x += alpha * p
+            r -= alpha * z
+            r_dot_new = torch.dot(r,r)
+            p = r + (r_dot_new / r_dot_old) * p
+            r_dot_old = r_dot_new
+        return x
+
+    def update():
+        data = buf.get()
+        with torch.no_grad():
+            pi_old = ac.pi._distribution(data['obs'])
+            v_l_old = compute_loss_v(data).item()
+
+        # Policy gradient, averaged across processes
+        ac.pi.zero_grad()
+        loss_pi, _ = compute_loss_pi(data)
+        loss_pi.backward()
+        g = flat_avg_grad()
+        pi_l_old = mpi_avg(loss_pi.item())
+
+        # Hessian-vector products of the KL, by double backprop through its
+        # gradient on a random subset of the states. The gradient's graph is
+        # built once and reused by every conjugate gradient iteration.
+        n = len(data['obs'])
+        idxs = torch.randperm(n)[:max(int(hvp_subsample * n), 1)]
+        with torch.no_grad():
+            pi_old_sub = ac.pi._distribution(data['obs'][idxs])
+        kl_sub = core.mean_kl(pi_old_sub, ac.pi._distribution(data['obs'][idxs]))
+        grad_kl = core.flat_grad(kl_sub, pi_params, create_graph=True)
+
+        def Hx(x):
+            ac.pi.zero_grad()
+            torch.dot(grad_kl, x).backward(retain_graph=True)
+            hvp = flat_avg_grad()
+            if damping_coeff > 0:
+                hvp += damping_coeff * x
+            return hvp
+
+        # Core calculations for TRPO or NPG
+        x = cg(Hx, g)
+        alpha = torch.sqrt(2*delta/(torch.dot(x, Hx(x))+EPS))
+        old_params = parameters_to_vector(pi_params).detach()
+
+        def set_and_eval(step):
+            vector_to_parameters(old_params - alpha * x * step, pi_params)
+            with torch.no_grad():
+                loss_pi, pi = compute_loss_pi(data)
+                kl = core.mean_kl(pi_old, pi)
+            return mpi_avg([kl.item(), loss_pi.item()])
+
+        if algo=='npg':
+            # npg has no backtracking or hard kl constraint enforcement
+            kl, pi_l_new = set_and_eval(step=1.)
+
+        elif algo=='trpo':
+            # trpo augments npg with backtracking line search, hard kl
+            for j in range(backtrack_iters):
+                kl, pi_l_new = set_and_eval(step=backtrack_coeff**j)
+                if kl <= delta and pi_l_new <= pi_l_old:
+                    logger.log('Accepting new params at step %d of line search.'%j)
+                    logger.store(BacktrackIters=j)
+                    break
+
+                if j==backtrack_iters-1:
+                    logger.log('Line search failed! Keeping old params.')
+                    logger.store(BacktrackIters=j)
+                    kl, pi_l_new = set_and_eval(step=0.)
+
+        # Value function learning
+        for i in range(train_v_iters):
+            vf_optimizer.zero_grad()
+            loss_v = compute_loss_v(data)
+            loss_v.backward()
+            mpi_avg_grads(ac.v)    # average grads across MPI processes
+            vf_optimizer.step()
+
+        # Log changes from update
+        logger.store(LossPi=pi_l_old, LossV=v_l_old, KL=kl,
+                     DeltaLossPi=(pi_l_new - pi_l_old),
+                     DeltaLossV=(loss_v.item() - v_l_old))
+
+    # Prepare for interaction with environment
+    start_time = time.time()
+    o, ep_ret, ep_len = env.reset(), 0, 0
+
+    # Main loop: collect experience in env and update/log each epoch
+    for epoch in range(epochs):
+        for t in range(local_steps_per_epoch):
+            a, v, logp = ac.step(torch.as_tensor(o, dtype=torch.float32))
+
+            next_o, r, d, _ = env.step(a)
+            ep_ret += r
+            ep_len += 1
+
+            # save and log
+            buf.store(o, a, r, v, logp)
+            logger.store(VVals=v)
+            
+            # Update obs (critical!)
+            o = next_o
+
+            timeout = ep_len == max_ep_len
+            terminal = d or timeout
+            epoch_ended = t==local_steps_per_epoch-1
+
+            if terminal or epoch_ended:
+                if epoch_ended and not(terminal):
+                    print('Warning: trajectory cut off by epoch at %d steps.'%ep_len, flush=True)
+                # if trajectory didn't reach terminal state, bootstrap value target
+                if timeout or epoch_ended:
+                    _, v, _ = ac.step(torch.as_tensor(o, dtype=torch.float32))
+                else:
+                    v = 0
+                buf.finish_path(v)
+                if terminal:
+                    # only save EpRet / EpLen if trajectory finished
+                    logger.store(EpRet=ep_ret, EpLen=ep_len)
+                o, ep_ret, ep_len = env.reset(), 0, 0
+
+
+        # Save model
+        if (epoch % save_freq == 0) or (epoch == epochs-1):
+            logger.save_state({'env': env}, None)
+
+        # Perform TRPO or NPG update!
+        update()
+
+        # Log info about epoch
+        logger.log_tabular('Epoch', epoch)
+        logger.log_tabular('EpRet', with_min_and_max=True)
+        logger.log_tabular('EpLen', average_only=True)
+        logger.log_tabular('VVals', with_min_and_max=True)
+        logger.log_tabular('TotalEnvInteracts', (epoch+1)*steps_per_epoch)
+        logger.log_tabular('LossPi', average_only=True)
+        logger.log_tabular('LossV', average_only=True)
+        logger.log_tabular('DeltaLossPi', average_only=True)
+        logger.log_tabular('DeltaLossV', average_only=True)
+        logger.log_tabular('KL', average_only=True)
+        if algo=='trpo':
+            logger.log_tabular('BacktrackIters', average_only=True)
+        logger.log_tabular('Time', time.time()-start_time)
+        logger.dump_tabular()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', type=str, default='HalfCheetah-v2')
+    parser.add_argument('--hid', type=int, default=64)
+    parser.add_argument('--l', type=int, default=2)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    parser.add_argument('--cpu', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=4000)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--exp_name', type=str, default='trpo')
+    args = parser.parse_args()
+
+    mpi_fork(args.cpu)  # run parallel code with mpi
+
+    from spinup.utils.run_utils import setup_logger_kwargs
+    logger_kwargs = setup_logger_kwargs(args.exp_name, args.seed)
+
+    trpo(lambda : gym.make(args.env), actor_critic=core.MLPActorCritic,
+         ac_kwargs=dict(hidden_sizes=[args.hid]*args.l), gamma=args.gamma, 
+         seed=args.seed, steps_per_epoch=args.steps, epochs=args.epochs,
+         logger_kwargs=logger_kwargs)
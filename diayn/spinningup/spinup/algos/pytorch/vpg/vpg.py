@@ -14,39 +14,46 @@ class VPGBuffer:
     A buffer for storing trajectories experienced by a VPG agent interacting
     with the environment, and using Generalized Advantage Estimation (GAE-Lambda)
     for calculating the advantages of state-action pairs.
+
+    Steps are laid out as (num_envs, T), one row per copy of the
+    environment, so a vectorized env can store all of its copies' steps at
+    once. Advantages and rewards-to-go are computed for every trajectory in
+    a single batched pass, when the data is taken out with ``get``.
     """
 
-    def __init__(self, obs_dim, act_dim, size, gamma=0.99, lam=0.95):
-        self.obs_buf = np.zeros(core.combined_shape(size, obs_dim), dtype=np.float32)
-        self.act_buf = np.zeros(core.combined_shape(size, act_dim), dtype=np.float32)
-        self.adv_buf = np.zeros(size, dtype=np.float32)
-        self.rew_buf = np.zeros(size, dtype=np.float32)
-        self.ret_buf = np.zeros(size, dtype=np.float32)
-        self.val_buf = np.zeros(size, dtype=np.float32)
-        self.logp_buf = np.zeros(size, dtype=np.float32)
+    def __init__(self, obs_dim, act_dim, size, gamma=0.99, lam=0.95, num_envs=1):
+        assert size % num_envs == 0     # every env gets the same number of steps
+        T = size // num_envs
+        self.obs_buf = np.zeros((num_envs, *core.combined_shape(T, obs_dim)), dtype=np.float32)
+        self.act_buf = np.zeros((num_envs, *core.combined_shape(T, act_dim)), dtype=np.float32)
+        self.rew_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.val_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.logp_buf = np.zeros((num_envs, T), dtype=np.float32)
+        self.end_buf = np.zeros((num_envs, T), dtype=bool)
+        self.last_val_buf = np.zeros((num_envs, T), dtype=np.float32)
         self.gamma, self.lam = gamma, lam
-        self.ptr, self.path_start_idx, self.max_size = 0, 0, size
+        self.ptr, self.max_size = 0, T
 
     def store(self, obs, act, rew, val, logp):
         """
-        Append one timestep of agent-environment interaction to the buffer.
+        Append one timestep of agent-environment interaction to the buffer:
+        one value per env (or just the value, with a single env).
         """
         assert self.ptr < self.max_size     # buffer has to have room so you can store
-        self.obs_buf[self.ptr] = obs
-        self.act_buf[self.ptr] = act
-        self.rew_buf[self.ptr] = rew
-        self.val_buf[self.ptr] = val
-        self.logp_buf[self.ptr] = logp
+        self.obs_buf[:, self.ptr] = obs
+        self.act_buf[:, self.ptr] = act
+        self.rew_buf[:, self.ptr] = rew
+        self.val_buf[:, self.ptr] = val
+        self.logp_buf[:, self.ptr] = logp
         self.ptr += 1
 
-    def finish_path(self, last_val=0):
+    def finish_path(self, last_val=0, env=None):
         """
         Call this at the end of a trajectory, or when one gets cut off
-        by an epoch ending. This looks back in the buffer to where the
-        trajectory started, and uses rewards and value estimates from
-        the whole trajectory to compute advantage estimates with GAE-Lambda,
-        as well as compute the rewards-to-go for each state, to use as
-        the targets for the value function.
+        by an epoch ending. This marks the last stored step of env ``env``
+        (of every env, if None) as the end of its trajectory; advantage
+        estimates with GAE-Lambda and rewards-to-go, the targets for the
+        value function, are computed from it in ``get``.
 
         The "last_val" argument should be 0 if the trajectory ended
         because the agent reached a terminal state (died), and otherwise
@@ -54,19 +61,9 @@ class VPGBuffer:
         This allows us to bootstrap the reward-to-go calculation to account
         for timesteps beyond the arbitrary episode horizon (or epoch cutoff).
         """
-
-        path_slice = slice(self.path_start_idx, self.ptr)
-        rews = np.append(self.rew_buf[path_slice], last_val)
-        vals = np.append(self.val_buf[path_slice], last_val)
-        
-        # the next two lines implement GAE-Lambda advantage calculation
-        deltas = rews[:-1] + self.gamma * vals[1:] - vals[:-1]
-        self.adv_buf[path_slice] = core.discount_cumsum(deltas, self.gamma * self.lam)
-        
-        # the next line computes rewards-to-go, to be targets for the value function
-        self.ret_buf[path_slice] = core.discount_cumsum(rews, self.gamma)[:-1]
-        
-        self.path_start_idx = self.ptr
+        envs = slice(None) if env is None else env
+        self.end_buf[envs, self.ptr - 1] = True
+        self.last_val_buf[envs, self.ptr - 1] = last_val
 
     def get(self):
         """
@@ -75,13 +72,29 @@ class VPGBuffer:
         mean zero and std one). Also, resets some pointers in the buffer.
         """
         assert self.ptr == self.max_size    # buffer has to be full before you can get
-        self.ptr, self.path_start_idx = 0, 0
+        assert self.end_buf[:, -1].all()    # and every trajectory finished
+        ends = self.end_buf
+        rews, vals, last_vals = self.rew_buf, self.val_buf, self.last_val_buf
+
+        # the next three lines implement GAE-Lambda advantage calculation,
+        # over every trajectory at once
+        next_vals = np.where(ends, last_vals, np.roll(vals, -1, axis=1))
+        deltas = rews + self.gamma * next_vals - vals
+        adv = core.discount_cumsum_paths(deltas, self.gamma * self.lam, ends)
+
+        # the next line computes rewards-to-go, to be targets for the value function
+        ret = core.discount_cumsum_paths(np.where(ends, rews + self.gamma * last_vals, rews),
+                                         self.gamma, ends)
+
+        self.ptr = 0
+        self.end_buf[:] = False
         # the next two lines implement the advantage normalization trick
-        adv_mean, adv_std = mpi_statistics_scalar(self.adv_buf)
-        self.adv_buf = (self.adv_buf - adv_mean) / adv_std
-        data = dict(obs=self.obs_buf, act=self.act_buf, ret=self.ret_buf,
-                    adv=self.adv_buf, logp=self.logp_buf)
-        return {k: torch.as_tensor(v, dtype=torch.float32) for k,v in data.items()}
+        adv_mean, adv_std = mpi_statistics_scalar(adv)
+        adv = (adv - adv_mean) / adv_std
+        data = dict(obs=self.obs_buf, act=self.act_buf, ret=ret, adv=adv, logp=self.logp_buf)
+        # one row per step, env by env
+        return {k: torch.as_tensor(v.reshape(-1, *v.shape[2:]), dtype=torch.float32)
+                for k,v in data.items()}
 
 
 
@@ -16,17 +16,19 @@ from textwrap import dedent
 
 # Command line args that will go to ExperimentGrid.run, and must possess unique
 # values (therefore must be treated separately).
-RUN_KEYS = ['num_cpu', 'data_dir', 'datestamp']
+RUN_KEYS = ['num_cpu', 'data_dir', 'datestamp', 'num_parallel', 'num_threads',
+            'retries', 'cpu_budget', 'sweep_resume', 'launcher']
 
 # Command line sweetener, allowing short-form flags for common, longer flags.
 SUBSTITUTIONS = {'env': 'env_name',
                  'hid': 'ac_kwargs:hidden_sizes',
                  'act': 'ac_kwargs:activation',
                  'cpu': 'num_cpu',
+                 'par': 'num_parallel',
                  'dt': 'datestamp'}
 
 # Only some algorithms can be parallelized (have num_cpu > 1):
-MPI_COMPATIBLE_ALGOS = ['vpg', 'trpo', 'ppo']
+MPI_COMPATIBLE_ALGOS = ['vpg', 'trpo', 'ppo', 'diayn']
 
 # Algo names (used in a few places)
 BASE_ALGO_NAMES = ['vpg', 'trpo', 'ppo', 'ddpg', 'td3', 'sac']
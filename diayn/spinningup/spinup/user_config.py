@@ -5,7 +5,7 @@ import os.path as osp
 # (Must be either 'tf1' or 'pytorch')
 DEFAULT_BACKEND = {
     'vpg': 'pytorch',
-    'trpo': 'tf1',
+    'trpo': 'pytorch',
     'ppo': 'pytorch',
     'ddpg': 'pytorch',
     'td3': 'pytorch',
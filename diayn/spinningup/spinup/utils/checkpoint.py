@@ -0,0 +1,220 @@
+"""
+
+Full training-state checkpoints, for resuming interrupted runs.
+
+A checkpoint holds everything an off-policy training loop needs to carry on
+as if it had never stopped: networks, target networks, optimizers, replay
+buffer, RNG states, the state of the envs mid-episode and the loop's own
+counters. They are written to ``<output_dir>/state/state<epoch>.pt``.
+
+Writes happen on a background thread: the training loop only pays for
+copying the state to CPU memory (see ``AsyncSaver``).
+
+"""
+import atexit
+import collections
+import copy
+import os
+import os.path as osp
+import queue
+import random
+import threading
+
+import gym
+import numpy as np
+import torch
+
+
+def atomic_torch_save(obj, fname):
+    """
+    ``torch.save`` to a temporary file next to ``fname``, then rename it.
+
+    The rename is atomic, so a crash mid-save leaves the previous file
+    intact instead of a truncated one.
+    """
+    tmp = fname + ".tmp%d" % os.getpid()
+    try:
+        torch.save(obj, tmp)
+        os.replace(tmp, fname)
+    finally:
+        if osp.exists(tmp):
+            os.remove(tmp)
+
+
+def get_rng_state():
+    """Snapshot the global python, numpy and torch RNGs."""
+    return dict(
+        python=random.getstate(),
+        numpy=np.random.get_state(),
+        torch=torch.get_rng_state(),
+    )
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+
+
+def get_env_state(env):
+    """
+    Snapshot an env mid-episode, or return None if it doesn't support it.
+
+    The innermost env must provide ``get_state``/``set_state`` (as the
+    dmc2gym and A1 envs do). For the gym wrappers around it, their plain
+    scalar attributes are kept, e.g. ``TimeLimit``'s step counter, and so
+    are their deques, e.g. the recent frames of a ``FrameStack``.
+    """
+    wrappers = []
+    while isinstance(env, gym.Wrapper):
+        wrappers.append({k: copy.deepcopy(v) for k, v in vars(env).items()
+                         if isinstance(v, (bool, int, float, type(None), collections.deque))})
+        env = env.env
+    if not hasattr(env, "get_state"):
+        return None
+    return dict(wrappers=wrappers, env=env.get_state())
+
+
+def set_env_state(env, state):
+    for attrs in state["wrappers"]:
+        vars(env).update(copy.deepcopy(attrs))
+        env = env.env
+    env.set_state(state["env"])
+
+
+def snapshot(obj):
+    """
+    Deep copy of ``obj`` with every tensor detached, moved to the CPU and cloned.
+
+    Training can carry on mutating the originals while the copy is written.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def latest_checkpoint(fpath):
+    """Path of the newest checkpoint of the run in ``fpath``, or None."""
+    state_dir = osp.join(fpath, "state")
+    if not osp.isdir(state_dir):
+        return None
+    epochs = [int(x[5:-3]) for x in os.listdir(state_dir)
+              if x.startswith("state") and x.endswith(".pt") and x[5:-3].isdigit()]
+    if not epochs:
+        return None
+    return osp.join(state_dir, "state%d.pt" % max(epochs))
+
+
+def load_checkpoint(fname):
+    """Load a checkpoint written by ``CheckpointWriter``, onto the CPU."""
+    try:
+        return torch.load(fname, map_location="cpu", weights_only=False)
+    except TypeError:
+        return torch.load(fname, map_location="cpu")
+
+
+class AsyncSaver:
+    """
+    Writes objects with ``atomic_torch_save`` on a background thread.
+
+    ``save`` snapshots the object to CPU memory and queues it. At most
+    ``max_queue`` snapshots wait behind the one being written before
+    ``save`` blocks, which bounds the memory held by pending saves. An error
+    in the writer is raised by the next call to ``save`` or ``wait``.
+    Pending saves are flushed when the interpreter exits.
+    """
+
+    def __init__(self, max_queue=1):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                obj, fname, callback = item
+                if self._error is None:
+                    atomic_torch_save(obj, fname)
+                    if callback is not None:
+                        callback(fname)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background save failed.") from error
+
+    def save(self, obj, fname, callback=None):
+        """
+        Snapshot ``obj`` now and write it to ``fname`` in the background.
+
+        ``callback(fname)`` runs on the writer thread once the file is
+        complete.
+        """
+        self._raise_error()
+        self._queue.put((snapshot(obj), fname, callback))
+
+    def wait(self):
+        """Block until every queued save is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+
+class CheckpointWriter:
+    """
+    Writes full training-state checkpoints in the background.
+
+    Checkpoints go to ``<output_dir>/state/state<epoch>.pt`` through an
+    ``AsyncSaver``. Each time one is complete, older ones are pruned: the
+    newest ``keep_last`` are kept, as well as every epoch that is a
+    multiple of ``keep_every`` (if given).
+    """
+
+    def __init__(self, output_dir, max_queue=1, keep_last=1, keep_every=None):
+        self.state_dir = osp.join(output_dir, "state")
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self._saver = AsyncSaver(max_queue)
+
+    def save(self, state, epoch):
+        """Snapshot ``state`` and write it as the checkpoint of ``epoch``."""
+        fname = osp.join(self.state_dir, "state%d.pt" % epoch)
+        self._saver.save(state, fname, self._prune)
+
+    def _prune(self, fname):
+        epochs = sorted(int(x[5:-3]) for x in os.listdir(self.state_dir)
+                        if x.startswith("state") and x.endswith(".pt") and x[5:-3].isdigit())
+        keep = set(epochs[-self.keep_last:]) if self.keep_last > 0 else set()
+        if self.keep_every:
+            keep |= {e for e in epochs if e % self.keep_every == 0}
+        for e in epochs:
+            if e not in keep:
+                os.remove(osp.join(self.state_dir, "state%d.pt" % e))
+
+    def wait(self):
+        """Block until every queued checkpoint is on disk."""
+        self._saver.wait()
+
+    def close(self):
+        self._saver.close()
@@ -0,0 +1,153 @@
+"""
+
+Roll out every skill of a saved DIAYN agent in one command.
+
+The checkpoint is loaded once; a pool of forked worker processes inherits
+it and rolls out one skill at a time, each in its own env. For every skill
+this writes ``<fpath>/<skill>/<skill>.mp4`` (with ``--write``) and one row of
+return and discriminator-confidence stats to ``<fpath>/skills.txt``.
+
+"""
+import json
+import multiprocessing
+import os
+import os.path as osp
+
+import gym
+import dmc2gym
+import numpy as np
+import torch
+from diayn.spinningup.spinup.utils.test_policy import load_pytorch_model, resolve_itr
+from diayn.spinningup.spinup.utils.video import VideoWriter
+
+# Set in the parent before the pool forks, so workers share them for free
+_model = None
+_env_fn = None
+
+
+def _init_worker():
+    # One torch thread per worker, the pool provides the parallelism
+    torch.set_num_threads(1)
+
+
+def rollout_skill(skill, n_skill, num_episodes=10, max_ep_len=1000,
+                  deterministic=False, save_dir=None):
+    """
+    Run ``num_episodes`` episodes of one skill and summarize them.
+
+    Returns a dict with the mean/std of the episode return, the mean episode
+    length, and the mean/std of the per-step discriminator probability of
+    the skill being played (``DiProbS``, as logged during training).
+    """
+    env = _env_fn()
+    sk = torch.as_tensor(np.eye(n_skill)[skill], dtype=torch.float32)
+
+    writer = None
+    if save_dir:
+        vid_path = osp.join(save_dir, str(skill))
+        os.makedirs(vid_path, exist_ok=True)
+        fps = env.metadata.get("video.frames_per_second", 50)
+        writer = VideoWriter(osp.join(vid_path, f"{skill}.mp4"), fps=fps, label=skill)
+
+    ep_rets, ep_lens, dcs = [], [], []
+    for _ in range(num_episodes):
+        o, d, ep_ret, ep_len = env.reset(), False, 0, 0
+        while not (d or ep_len == max_ep_len):
+            if writer:
+                writer.write(env.render(mode="rgb_array"))
+            x = torch.as_tensor(o, dtype=torch.float32)
+            with torch.no_grad():
+                dcs.append(_model.di(x).softmax(-1)[skill].item())
+            o, r, d, _ = env.step(_model.act(sk, x, deterministic))
+            ep_ret += r
+            ep_len += 1
+        ep_rets.append(ep_ret)
+        ep_lens.append(ep_len)
+
+    if writer:
+        writer.close()
+    env.close()
+
+    return dict(
+        Skill=skill,
+        AverageEpRet=np.mean(ep_rets),
+        StdEpRet=np.std(ep_rets),
+        EpLen=np.mean(ep_lens),
+        AverageDiProbS=np.mean(dcs),
+        StdDiProbS=np.std(dcs),
+    )
+
+
+def export_skills(fpath, env_fn, itr="last", num_episodes=10, max_ep_len=1000,
+                  deterministic=False, write=False, workers=None):
+    """
+    Roll out all skills of the checkpoint in ``fpath`` across a process pool.
+
+    Returns the list of per-skill summaries (see ``rollout_skill``), which
+    are also written to ``<fpath>/skills.txt``.
+    """
+    global _model, _env_fn
+
+    with open(osp.join(fpath, "config.json")) as f:
+        n_skill = json.load(f)["n_skill"]
+
+    _model = load_pytorch_model(fpath, resolve_itr(fpath, itr))
+    _env_fn = env_fn
+
+    workers = workers or min(n_skill, os.cpu_count())
+    args = [(skill, n_skill, num_episodes, max_ep_len, deterministic,
+             fpath if write else None) for skill in range(n_skill)]
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(workers, initializer=_init_worker) as pool:
+        rows = pool.starmap(rollout_skill, args)
+
+    headers = list(rows[0].keys())
+    with open(osp.join(fpath, "skills.txt"), "w") as f:
+        f.write("\t".join(headers) + "\n")
+        for row in rows:
+            f.write("\t".join(str(row[h]) for h in headers) + "\n")
+
+    print("\t".join("%12s" % h for h in headers))
+    for row in rows:
+        print("\t".join("%12.3g" % row[h] for h in headers))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fpath", type=str)
+    parser.add_argument("--env_id", type=str)
+    parser.add_argument("--domain_name", type=str)
+    parser.add_argument("--task_name", type=str)
+    parser.add_argument("--len", "-l", type=int, default=1000)
+    parser.add_argument("--episodes", "-n", type=int, default=10)
+    parser.add_argument("--write", "-w", action="store_true")
+    parser.add_argument("--itr", "-i", type=int, default=-1)
+    parser.add_argument("--deterministic", "-d", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", "-s", type=int, default=0)
+    args = parser.parse_args()
+
+    assert args.env_id or (
+        args.domain_name and args.task_name
+    ), "Can't create environment"
+    env_fn = (
+        (lambda: gym.make(args.env_id))
+        if args.env_id
+        else (lambda: dmc2gym.make(
+            domain_name=args.domain_name, task_name=args.task_name, seed=args.seed
+        ))
+    )
+
+    export_skills(
+        args.fpath,
+        env_fn,
+        args.itr if args.itr >= 0 else "last",
+        args.episodes,
+        args.len,
+        args.deterministic,
+        args.write,
+        args.workers,
+    )
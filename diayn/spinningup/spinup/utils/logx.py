@@ -3,9 +3,12 @@
 Some simple logging functionality, inspired by rllab's logging.
 
 Logs to a tab-separated-values file (path/to/output_directory/progress.txt)
+and to a binary store next to it (path/to/output_directory/progress/),
+which also holds vector-valued diagnostics (see ``spinup.utils.metrics_store``).
 
 """
 import json
+import importlib
 import joblib
 import shutil
 import numpy as np
@@ -13,8 +16,11 @@ import numpy as np
 import torch
 import os.path as osp, time, atexit, os
 import warnings
-from diayn.spinningup.spinup.utils.mpi_tools import proc_id, mpi_statistics_scalar
+from diayn.spinningup.spinup.utils.mpi_tools import proc_id, mpi_statistics_scalar, \
+    mpi_statistics_batch, mpi_sum
 from diayn.spinningup.spinup.utils.serialization_utils import convert_json
+from diayn.spinningup.spinup.utils.checkpoint import AsyncSaver, atomic_torch_save
+from diayn.spinningup.spinup.utils.metrics_store import MetricsWriter
 
 color2num = dict(
     gray=30,
@@ -68,6 +74,72 @@ def colorize(string, color, bold=False, highlight=False):
 #     model.update({k: graph.get_tensor_by_name(v) for k,v in model_info['outputs'].items()})
 #     return model
 
+def _qualname(obj):
+    return '%s.%s' % (obj.__module__, obj.__qualname__)
+
+def _import_qualname(name):
+    module, attr = name.rsplit('.', 1)
+    return getattr(importlib.import_module(module), attr)
+
+def pytorch_model_spec(actor_critic, observation_space, action_space,
+                       ac_kwargs=dict(), n_skill=None):
+    """
+    Describe how to rebuild an actor-critic, as a JSON-serializable dict.
+
+    Pass the result to ``logger.setup_pytorch_saver`` to save only the
+    model's weights; ``restore_pytorch_model`` rebuilds the module from it.
+    Only the observation shape, action dim and action limit of the spaces
+    are kept, which is all the MLP and CNN actor-critics use.
+    """
+    kwargs = {k: _qualname(v) if isinstance(v, type) else
+                 list(v) if isinstance(v, tuple) else v
+              for k, v in ac_kwargs.items()}
+    return dict(actor_critic=_qualname(actor_critic),
+                n_skill=n_skill,
+                obs_shape=[int(n) for n in observation_space.shape],
+                act_dim=int(action_space.shape[0]),
+                act_limit=float(action_space.high[0]),
+                ac_kwargs=convert_json(kwargs))
+
+def restore_pytorch_model(fpath, itr=''):
+    """
+    Loads a model saved by Logger with a ``pytorch_model_spec``.
+
+    The module is rebuilt from ``model.json`` and ``model{itr}.pt`` is
+    memory-mapped, so its weights are paged in lazily rather than read and
+    copied up front (on PyTorch versions without ``mmap``, it is read
+    normally).
+
+    Args:
+        fpath: Filepath to the ``pyt_save`` directory.
+        itr: Suffix of the saved weights, e.g. ``''`` or ``'50'``.
+
+    Returns:
+        The actor-critic module, in eval mode.
+    """
+    import gym
+    with open(osp.join(fpath, 'model.json')) as f:
+        spec = json.load(f)
+    kwargs = dict(spec['ac_kwargs'])
+    if 'activation' in kwargs:
+        kwargs['activation'] = _import_qualname(kwargs['activation'])
+    obs_shape = spec['obs_shape'] if 'obs_shape' in spec else [spec['obs_dim']]
+    obs_space = gym.spaces.Box(-np.inf, np.inf, tuple(obs_shape), dtype=np.float32)
+    act_space = gym.spaces.Box(-spec['act_limit'], spec['act_limit'],
+                               (spec['act_dim'],), dtype=np.float32)
+    args = [obs_space, act_space]
+    if spec['n_skill'] is not None:
+        args.insert(0, spec['n_skill'])
+    model = _import_qualname(spec['actor_critic'])(*args, **kwargs)
+
+    fname = osp.join(fpath, 'model' + itr + '.pt')
+    try:
+        state_dict = torch.load(fname, map_location='cpu', mmap=True, weights_only=True)
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        model.load_state_dict(torch.load(fname, map_location='cpu'))
+    return model.eval()
+
 class Logger:
     """
     A general-purpose logger.
@@ -76,7 +148,8 @@ class Logger:
     state of a training run, and the trained model.
     """
 
-    def __init__(self, output_dir=None, output_fname='progress.txt', exp_name=None):
+    def __init__(self, output_dir=None, output_fname='progress.txt', exp_name=None,
+                 resume=False):
         """
         Initialize a Logger.
 
@@ -94,24 +167,54 @@ class Logger:
                 will know to group them. (Use case: if you run the same
                 hyperparameter configuration with multiple random seeds, you
                 should give them all the same ``exp_name``.)
+
+            resume (bool): Keep the existing output files instead of
+                truncating them; call ``restore_progress`` before logging.
         """
         if proc_id()==0:
             self.output_dir = output_dir or "/tmp/experiments/%i"%int(time.time())
             if osp.exists(self.output_dir):
-                print("Warning: Log dir %s already exists! Storing info there anyway."%self.output_dir)
+                if not resume:
+                    print("Warning: Log dir %s already exists! Storing info there anyway."%self.output_dir)
             else:
                 os.makedirs(self.output_dir)
-            self.output_file = open(osp.join(self.output_dir, output_fname), 'w')
+            fname = osp.join(self.output_dir, output_fname)
+            self.output_file = open(fname, 'r+' if resume and osp.exists(fname) else 'w')
             atexit.register(self.output_file.close)
             print(colorize("Logging data to %s"%self.output_file.name, 'green', bold=True))
+            self.metrics_writer = MetricsWriter(osp.splitext(fname)[0], resume=resume)
         else:
             self.output_dir = None
             self.output_file = None
+            self.metrics_writer = None
         self.first_row=True
         self.log_headers = []
         self.log_current_row = {}
         self.exp_name = exp_name
 
+    def restore_progress(self, n_rows):
+        """
+        Drop all but the first ``n_rows`` rows of the output file and log after them.
+
+        Used when resuming a run from a checkpoint taken after ``n_rows``
+        calls to ``dump_tabular``: rows logged after the checkpoint are
+        discarded, since the resumed run logs them again.
+        """
+        if proc_id()==0:
+            self.output_file.seek(0)
+            lines = self.output_file.readlines()
+            self.output_file.seek(0)
+            self.output_file.truncate()
+            self.metrics_writer.truncate(n_rows)
+            if n_rows > 0 and lines:
+                self.output_file.writelines(lines[:n_rows + 1])
+                self.output_file.flush()
+                self.log_headers = lines[0].rstrip('\n').split('\t')
+                if self.metrics_writer.schema is not None:
+                    # also knows the vector-valued keys
+                    self.log_headers = [c['name'] for c in self.metrics_writer.schema]
+                self.first_row = False
+
     def log(self, msg, color='green'):
         """Print a colorized message to stdout."""
         if proc_id()==0:
@@ -125,6 +228,9 @@ class Logger:
         After using ``log_tabular`` to store values for each diagnostic,
         make sure to call ``dump_tabular`` to write them out to file and
         stdout (otherwise they will not get saved anywhere).
+
+        ``val`` may also be an array of fixed shape, e.g. one value per
+        skill. Those only go to the metrics store.
         """
         if self.first_row:
             self.log_headers.append(key)
@@ -229,7 +335,7 @@ class Logger:
     #         joblib.dump(self.tf_saver_info, osp.join(fpath, 'model_info.pkl'))
     
 
-    def setup_pytorch_saver(self, what_to_save):
+    def setup_pytorch_saver(self, what_to_save, spec=None):
         """
         Set up easy model saving for a single PyTorch model.
 
@@ -242,8 +348,23 @@ class Logger:
         Args:
             what_to_save: Any PyTorch model or serializable object containing
                 PyTorch models.
+
+            spec (dict): Optional architecture spec from
+                ``pytorch_model_spec``. If given, only the ``state_dict`` of
+                ``what_to_save`` is saved, next to the spec in
+                ``model.json``, and the model is loaded back with
+                ``restore_pytorch_model``. These saves are written on a
+                background thread; see ``wait_saves``.
         """
         self.pytorch_saver_elements = what_to_save
+        self.pytorch_saver_spec = spec
+        if spec is not None and proc_id()==0:
+            self.pytorch_saver = AsyncSaver()
+
+    def wait_saves(self):
+        """Block until every model save queued so far is on disk."""
+        if hasattr(self, 'pytorch_saver'):
+            self.pytorch_saver.wait()
 
     def _pytorch_simple_save(self, itr=None):
         """
@@ -257,6 +378,13 @@ class Logger:
             fname = 'model' + ('%d'%itr if itr is not None else '') + '.pt'
             fname = osp.join(fpath, fname)
             os.makedirs(fpath, exist_ok=True)
+            if getattr(self, 'pytorch_saver_spec', None) is not None:
+                spec_fname = osp.join(fpath, 'model.json')
+                with open(spec_fname + '.tmp', 'w') as out:
+                    json.dump(self.pytorch_saver_spec, out, indent=4, sort_keys=True)
+                os.replace(spec_fname + '.tmp', spec_fname)
+                self.pytorch_saver.save(self.pytorch_saver_elements.state_dict(), fname)
+                return
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
                 # We are using a non-recommended way of saving PyTorch models,
@@ -267,7 +395,7 @@ class Logger:
                 # something different for your personal PyTorch project.
                 # We use a catch_warnings() context to avoid the warnings about
                 # not being able to save the source code.
-                torch.save(self.pytorch_saver_elements, fname)
+                atomic_torch_save(self.pytorch_saver_elements, fname)
 
 
     def dump_tabular(self):
@@ -278,13 +406,16 @@ class Logger:
         """
         if proc_id()==0:
             vals = []
-            key_lens = [len(key) for key in self.log_headers]
+            # vector-valued diagnostics only go to the metrics store
+            headers = [key for key in self.log_headers
+                       if np.ndim(self.log_current_row.get(key, "")) == 0]
+            key_lens = [len(key) for key in headers]
             max_key_len = max(15,max(key_lens))
             keystr = '%'+'%d'%max_key_len
             fmt = "| " + keystr + "s | %15s |"
             n_slashes = 22 + max_key_len
             print("-"*n_slashes)
-            for key in self.log_headers:
+            for key in headers:
                 val = self.log_current_row.get(key, "")
                 valstr = "%8.3g"%val if hasattr(val, "__float__") else val
                 print(fmt%(key, valstr))
@@ -292,9 +423,12 @@ class Logger:
             print("-"*n_slashes, flush=True)
             if self.output_file is not None:
                 if self.first_row:
-                    self.output_file.write("\t".join(self.log_headers)+"\n")
+                    self.output_file.write("\t".join(headers)+"\n")
                 self.output_file.write("\t".join(map(str,vals))+"\n")
                 self.output_file.flush()
+            if self.metrics_writer is not None:
+                self.metrics_writer.append(
+                    {key: self.log_current_row.get(key, np.nan) for key in self.log_headers})
         self.log_current_row.clear()
         self.first_row=False
 
@@ -321,11 +455,15 @@ class EpochLogger(Logger):
         epoch_logger.log_tabular(NameOfQuantity, **options)
 
     to record the desired values.
+
+    The statistics of all diagnostics logged this way are computed together
+    in ``dump_tabular``, with two MPI collective calls in total.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.epoch_dict = dict()
+        self.pending_stats = []
 
     def store(self, **kwargs):
         """
@@ -361,21 +499,55 @@ class EpochLogger(Logger):
         if val is not None:
             super().log_tabular(key,val)
         else:
-            v = self.epoch_dict[key]
-            vals = np.concatenate(v) if isinstance(v[0], np.ndarray) and len(v[0].shape)>0 else v
-            stats = mpi_statistics_scalar(vals, with_min_and_max=with_min_and_max)
-            super().log_tabular(key if average_only else 'Average' + key, stats[0])
+            # A process may have nothing for key (e.g. an MPI actor for losses)
+            v = self.epoch_dict.get(key, [])
+            vals = np.concatenate(v) if len(v)>0 and isinstance(v[0], np.ndarray) and len(v[0].shape)>0 else v
+            # Keep the columns' places, dump_tabular fills them in. Each
+            # column indexes into the key's (mean, std, min, max).
+            columns = [(key if average_only else 'Average' + key, 0)]
             if not(average_only):
-                super().log_tabular('Std'+key, stats[1])
+                columns.append(('Std'+key, 1))
             if with_min_and_max:
-                super().log_tabular('Max'+key, stats[3])
-                super().log_tabular('Min'+key, stats[2])
+                columns += [('Max'+key, 3), ('Min'+key, 2)]
+            for name, _ in columns:
+                super().log_tabular(name, None)
+            self.pending_stats.append((columns, vals, with_min_and_max))
         self.epoch_dict[key] = []
 
+    def dump_tabular(self):
+        """
+        Compute the statistics of every diagnostic logged since the last
+        call, across MPI processes, then write them all out.
+        """
+        if self.pending_stats:
+            all_stats = mpi_statistics_batch([vals for _, vals, _ in self.pending_stats],
+                                             [mm for _, _, mm in self.pending_stats])
+            for (columns, _, _), stats in zip(self.pending_stats, all_stats):
+                for name, i in columns:
+                    self.log_current_row[name] = stats[i]
+            self.pending_stats = []
+        super().dump_tabular()
+
+    def get_group_means(self, key, groups, n_groups):
+        """
+        Lets an algorithm ask the logger for the mean of a diagnostic per group.
+
+        ``groups`` gives the group (e.g. the skill) of each value stored
+        under ``key`` so far this epoch. Returns an array of ``n_groups``
+        means, NaN for groups without values. Doesn't clear ``key``.
+        """
+        vals = np.asarray(self.epoch_dict.get(key, []), dtype=np.float64)
+        groups = np.asarray(groups, dtype=np.int64)
+        sums, counts = mpi_sum(np.concatenate([
+            np.bincount(groups, weights=vals, minlength=n_groups),
+            np.bincount(groups, minlength=n_groups)])).reshape(2, n_groups)
+        with np.errstate(invalid='ignore'):
+            return sums / counts
+
     def get_stats(self, key):
         """
         Lets an algorithm ask the logger for mean/std/min/max of a diagnostic.
         """
-        v = self.epoch_dict[key]
-        vals = np.concatenate(v) if isinstance(v[0], np.ndarray) and len(v[0].shape)>0 else v
+        v = self.epoch_dict.get(key, [])
+        vals = np.concatenate(v) if len(v)>0 and isinstance(v[0], np.ndarray) and len(v[0].shape)>0 else v
         return mpi_statistics_scalar(vals)
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+
+Append-only binary store for the diagnostics written by Logger.
+
+Next to ``progress.txt``, every row is also written to
+``<output_dir>/progress/``:
+
+    schema.json     column names, dtypes and shapes, in logging order
+    rows.bin        one fixed-width record per row, laid out as the numpy
+                    structured dtype described by the schema
+
+Columns can be vectors (e.g. one value per skill), which progress.txt can't
+hold. Appending a row is a single write at the end of ``rows.bin``. Loading
+a run is a single read with no text parsing, and every column is then a
+view into it; a partially written last record (after a crash) is ignored.
+
+"""
+import json
+import os
+import os.path as osp
+
+import numpy as np
+
+SCHEMA_FNAME = "schema.json"
+ROWS_FNAME = "rows.bin"
+
+
+def load_schema(path):
+    """The list of ``dict(name, dtype, shape)`` columns of the store at ``path``."""
+    with open(osp.join(path, SCHEMA_FNAME)) as f:
+        return json.load(f)["columns"]
+
+
+def schema_dtype(schema):
+    """The numpy structured dtype of one row."""
+    return np.dtype([(c["name"], c["dtype"], tuple(c["shape"])) for c in schema])
+
+
+def load_metrics(path, columns=None):
+    """
+    Read a metrics store into a dict of arrays, one row per logged epoch.
+
+    Args:
+        path (string): The store's directory (``<output_dir>/progress``).
+
+        columns (list): Names of the columns to return. Defaults to all.
+    """
+    schema = load_schema(path)
+    dtype = schema_dtype(schema)
+    fname = osp.join(path, ROWS_FNAME)
+    n_rows = osp.getsize(fname) // dtype.itemsize if osp.exists(fname) else 0
+    rows = np.fromfile(fname, dtype=dtype, count=n_rows) if n_rows else np.zeros(0, dtype)
+    columns = dtype.names if columns is None else columns
+    return {c: rows[c] for c in dtype.names if c in columns}
+
+
+def load_metrics_dataframe(path, columns=None):
+    """
+    Read the scalar columns of a metrics store as a ``pandas.DataFrame``.
+
+    Vector columns are skipped; use ``load_metrics`` for those.
+    """
+    import pandas as pd
+
+    scalars = [c["name"] for c in load_schema(path) if not c["shape"]]
+    if columns is not None:
+        scalars = [c for c in scalars if c in columns]
+    return pd.DataFrame(load_metrics(path, scalars), columns=scalars)
+
+
+class MetricsWriter:
+    """
+    Appends rows of diagnostics to a metrics store.
+
+    The schema is fixed by the first row: the dtype and shape of each value
+    in it. Later rows are cast to it.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        Args:
+            path (string): Directory of the store, created if needed.
+
+            resume (bool): Keep appending to an existing store. Otherwise
+                any previous contents of ``path`` are removed.
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.schema = None
+        self._dtype = None
+        if resume and osp.exists(osp.join(path, SCHEMA_FNAME)):
+            self.schema = load_schema(path)
+            self._dtype = schema_dtype(self.schema)
+            # drop a record cut short by a crash
+            fname = osp.join(path, ROWS_FNAME)
+            if osp.exists(fname):
+                n_rows = osp.getsize(fname) // self._dtype.itemsize
+                os.truncate(fname, n_rows * self._dtype.itemsize)
+        else:
+            self._clear()
+
+    def _clear(self):
+        for fname in [ROWS_FNAME, SCHEMA_FNAME]:
+            if osp.exists(osp.join(self.path, fname)):
+                os.remove(osp.join(self.path, fname))
+
+    def append(self, row):
+        """Write one row, a dict with a value (scalar or array) per column."""
+        if self.schema is None:
+            self.schema = []
+            for k, v in row.items():
+                v = np.asarray(v)
+                dtype = v.dtype.str
+                if v.dtype.kind in "US":
+                    # leave room for longer strings in later rows
+                    length = v.dtype.itemsize // np.dtype((v.dtype.kind, 1)).itemsize
+                    dtype = np.dtype((v.dtype.kind, max(64, length))).str
+                self.schema.append(dict(name=k, dtype=dtype, shape=list(v.shape)))
+            self._dtype = schema_dtype(self.schema)
+            tmp = osp.join(self.path, SCHEMA_FNAME + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(dict(version=1, columns=self.schema), f, indent=4)
+            os.replace(tmp, osp.join(self.path, SCHEMA_FNAME))
+
+        record = np.zeros(1, dtype=self._dtype)
+        for c in self.schema:
+            record[c["name"]] = row[c["name"]]
+        with open(osp.join(self.path, ROWS_FNAME), "ab") as f:
+            f.write(record.tobytes())
+
+    def truncate(self, n_rows):
+        """Drop all rows after the first ``n_rows``."""
+        fname = osp.join(self.path, ROWS_FNAME)
+        if self._dtype is not None and osp.exists(fname):
+            size = min(osp.getsize(fname), n_rows * self._dtype.itemsize)
+            os.truncate(fname, size)
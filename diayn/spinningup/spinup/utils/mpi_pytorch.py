@@ -2,8 +2,9 @@ import multiprocessing
 import numpy as np
 import os
 import torch
+import weakref
 from mpi4py import MPI
-from spinup.utils.mpi_tools import broadcast, mpi_avg, num_procs, proc_id
+from diayn.spinningup.spinup.utils.mpi_tools import broadcast, num_procs, proc_id
 
 def setup_pytorch_for_mpi():
     """
@@ -17,19 +18,52 @@ def setup_pytorch_for_mpi():
     torch.set_num_threads(fair_num_threads)
     #print('Proc %d: Reporting new number of Torch threads as %d.'%(proc_id(), torch.get_num_threads()), flush=True)
 
+# Persistent flat communication buffers, one per module
+_flat_buffers = weakref.WeakKeyDictionary()
+
+def _flat_buffer(module, tensors):
+    """
+    A contiguous tensor as big as ``tensors`` put together, kept for the
+    next call on ``module`` (remade only if the total size changes).
+    """
+    numel = sum(t.numel() for t in tensors)
+    flat = _flat_buffers.get(module)
+    if flat is None or flat.numel() != numel or flat.dtype != tensors[0].dtype:
+        flat = torch.empty(numel, dtype=tensors[0].dtype)
+        _flat_buffers[module] = flat
+    return flat
+
+def _unflatten(flat, tensors):
+    offset = 0
+    for t in tensors:
+        t.copy_(flat[offset:offset + t.numel()].view_as(t))
+        offset += t.numel()
+
 def mpi_avg_grads(module):
-    """ Average contents of gradient buffers across MPI processes. """
+    """
+    Average contents of gradient buffers across MPI processes.
+
+    All gradients of ``module`` are copied into one flat buffer and
+    averaged with a single ``Allreduce``, instead of one per parameter
+    tensor: with many small layers, the cost is per message, not per byte.
+    """
     if num_procs()==1:
         return
-    for p in module.parameters():
-        p_grad_numpy = p.grad.numpy()   # numpy view of tensor data
-        avg_p_grad = mpi_avg(p.grad)
-        p_grad_numpy[:] = avg_p_grad[:]
+    grads = [p.grad for p in module.parameters()]
+    flat = _flat_buffer(module, grads)
+    torch.cat([g.reshape(-1) for g in grads], out=flat)
+    MPI.COMM_WORLD.Allreduce(MPI.IN_PLACE, flat.numpy(), op=MPI.SUM)
+    flat /= num_procs()
+    _unflatten(flat, grads)
 
 def sync_params(module):
     """ Sync all parameters of module across all MPI processes. """
     if num_procs()==1:
         return
-    for p in module.parameters():
-        p_numpy = p.data.numpy()
-        broadcast(p_numpy)
\ No newline at end of file
+    params = [p.data for p in module.parameters()]
+    flat = _flat_buffer(module, params)
+    if proc_id()==0:
+        torch.cat([p.reshape(-1) for p in params], out=flat)
+    broadcast(flat.numpy())
+    if proc_id()!=0:
+        _unflatten(flat, params)
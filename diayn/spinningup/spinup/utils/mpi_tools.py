@@ -53,11 +53,28 @@ def num_procs():
 def broadcast(x, root=0):
     MPI.COMM_WORLD.Bcast(x, root=root)
 
+def broadcast_object(x, root=0):
+    """Send any picklable object from the root process to all others."""
+    return MPI.COMM_WORLD.bcast(x, root=root)
+
+def allgather(x):
+    """Stack same-shaped arrays from all processes, on every process."""
+    x = np.ascontiguousarray(x)
+    buff = np.empty((num_procs(),) + x.shape, dtype=x.dtype)
+    MPI.COMM_WORLD.Allgather(x, buff)
+    return buff
+
+def gather(x, root=0):
+    """Stack same-shaped arrays from all processes, on the root process only."""
+    x = np.ascontiguousarray(x)
+    buff = np.empty((num_procs(),) + x.shape, dtype=x.dtype) if proc_id()==root else None
+    MPI.COMM_WORLD.Gather(x, buff, root=root)
+    return buff
+
 def mpi_op(x, op):
     x, scalar = ([x], True) if np.isscalar(x) else (x, False)
-    x = np.asarray(x, dtype=np.float32)
-    buff = np.zeros_like(x, dtype=np.float32)
-    allreduce(x, buff, op=op)
+    buff = np.array(x, dtype=np.float32)
+    allreduce(MPI.IN_PLACE, buff, op=op)
     return buff[0] if scalar else buff
 
 def mpi_sum(x):
@@ -78,15 +95,50 @@ def mpi_statistics_scalar(x, with_min_and_max=False):
         with_min_and_max (bool): If true, return min and max of x in 
             addition to mean and std.
     """
-    x = np.array(x, dtype=np.float32)
-    global_sum, global_n = mpi_sum([np.sum(x), len(x)])
-    mean = global_sum / global_n
-
-    global_sum_sq = mpi_sum(np.sum((x - mean)**2))
-    std = np.sqrt(global_sum_sq / global_n)  # compute global std
-
-    if with_min_and_max:
-        global_min = mpi_op(np.min(x) if len(x) > 0 else np.inf, op=MPI.MIN)
-        global_max = mpi_op(np.max(x) if len(x) > 0 else -np.inf, op=MPI.MAX)
-        return mean, std, global_min, global_max
-    return mean, std
\ No newline at end of file
+    return mpi_statistics_batch([x], [with_min_and_max])[0]
+
+def mpi_statistics_batch(xs, with_min_and_max=False):
+    """
+    Get mean/std and optional min/max of several scalars across MPI processes.
+
+    Same results as ``mpi_statistics_scalar`` for each array in ``xs``, but
+    with one ``Allreduce`` for the counts, sums and sums of squares of all
+    of them, plus one for all the mins and maxes: the number of collective
+    calls doesn't grow with the number of diagnostics.
+
+    Args:
+        xs: A list of arrays of samples, one per scalar.
+
+        with_min_and_max (bool or list): Whether to also return min and
+            max, for all arrays or for each one.
+
+    Returns:
+        A list with a ``(mean, std)`` or ``(mean, std, min, max)`` tuple
+        of float32 values per array.
+    """
+    xs = [np.asarray(x, dtype=np.float64).ravel() for x in xs]
+    if np.isscalar(with_min_and_max):
+        with_min_and_max = [with_min_and_max] * len(xs)
+
+    # Moments in float64, so that E[x^2] - E[x]^2 doesn't lose the std
+    moments = np.array([[len(x), np.sum(x), np.sum(x**2)] for x in xs]).reshape(-1, 3)
+    allreduce(MPI.IN_PLACE, moments, op=MPI.SUM)
+    n, total, total_sq = moments.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        std = np.sqrt(np.maximum(total_sq / n - mean**2, 0))
+
+    # Maxes are reduced as negated mins, so both fit in one MIN allreduce
+    extremes = np.array([[np.min(x), -np.max(x)] if len(x) > 0 else [np.inf, np.inf]
+                         for x, mm in zip(xs, with_min_and_max) if mm]).reshape(-1, 2)
+    if any(with_min_and_max):
+        allreduce(MPI.IN_PLACE, extremes, op=MPI.MIN)
+
+    stats, i = [], 0
+    for k, mm in enumerate(with_min_and_max):
+        s = (mean[k], std[k])
+        if mm:
+            s += (extremes[i, 0], -extremes[i, 1])
+            i += 1
+        stats.append(tuple(np.float32(v) for v in s))
+    return stats
\ No newline at end of file
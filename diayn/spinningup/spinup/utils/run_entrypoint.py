@@ -1,3 +1,5 @@
+import os
+import time
 import zlib
 import pickle
 import base64
@@ -8,4 +10,8 @@ if __name__ == '__main__':
     parser.add_argument('encoded_thunk')
     args = parser.parse_args()
     thunk = pickle.loads(zlib.decompress(base64.b64decode(args.encoded_thunk)))
+    if 'SPINUP_LAUNCH_TIME' in os.environ:
+        # Lets the scheduler measure how long it took to get here
+        print('Experiment started after %.3f s'
+              % (time.time() - float(os.environ['SPINUP_LAUNCH_TIME'])), flush=True)
     thunk()
\ No newline at end of file
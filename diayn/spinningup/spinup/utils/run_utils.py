@@ -2,10 +2,14 @@ from diayn.spinningup.spinup.user_config import DEFAULT_DATA_DIR, FORCE_DATESTAM
                                DEFAULT_SHORTHAND, WAIT_BEFORE_LAUNCH
 from diayn.spinningup.spinup.utils.logx import colorize
 from diayn.spinningup.spinup.utils.mpi_tools import mpi_fork, msg
+from diayn.spinningup.spinup.utils.checkpoint import latest_checkpoint
+from diayn.spinningup.spinup.utils.scheduler import Job, LocalScheduler, print_summary, \
+                               load_job_state, is_complete
 from diayn.spinningup.spinup.utils.serialization_utils import convert_json
 import base64
 from copy import deepcopy
 import cloudpickle
+import inspect
 import json
 import numpy as np
 import os
@@ -127,46 +131,19 @@ def call_experiment(exp_name, thunk, seed=0, num_cpu=1, data_dir=None,
 
     """
 
-    # Determine number of CPU cores to run on
-    num_cpu = psutil.cpu_count(logical=False) if num_cpu=='auto' else num_cpu
-
-    # Send random seed to thunk
-    kwargs['seed'] = seed
-
     # Be friendly and print out your kwargs, so we all know what's up
     print(colorize('Running experiment:\n', color='cyan', bold=True))
     print(exp_name + '\n')
     print(colorize('with kwargs:\n', color='cyan', bold=True))
-    kwargs_json = convert_json(kwargs)
+    kwargs_json = convert_json(dict(kwargs, seed=seed))
     print(json.dumps(kwargs_json, separators=(',',':\t'), indent=4, sort_keys=True))
     print('\n')
 
-    # Set up logger output directory
-    if 'logger_kwargs' not in kwargs:
-        kwargs['logger_kwargs'] = setup_logger_kwargs(exp_name, seed, data_dir, datestamp)
-    else:
+    if 'logger_kwargs' in kwargs:
         print('Note: Call experiment is not handling logger_kwargs.\n')
 
-    def thunk_plus():
-        # Make 'env_fn' from 'env_name'
-        if 'env_name' in kwargs:
-            import gym
-            env_name = kwargs['env_name']
-            kwargs['env_fn'] = lambda : gym.make(env_name)
-            del kwargs['env_name']
-
-        # Fork into multiple processes
-        mpi_fork(num_cpu)
-
-        # Run thunk
-        thunk(**kwargs)
-
-    # Prepare to launch a script to run the experiment
-    pickled_thunk = cloudpickle.dumps(thunk_plus)
-    encoded_thunk = base64.b64encode(zlib.compress(pickled_thunk)).decode('utf-8')
-
-    entrypoint = osp.join(osp.abspath(osp.dirname(__file__)),'run_entrypoint.py')
-    cmd = [sys.executable if sys.executable else 'python', entrypoint, encoded_thunk]
+    cmd, kwargs = experiment_command(exp_name, thunk, seed, num_cpu, data_dir,
+                                     datestamp, **kwargs)
     try:
         subprocess.check_call(cmd, env=os.environ)
     except CalledProcessError:
@@ -211,6 +188,50 @@ def call_experiment(exp_name, thunk, seed=0, num_cpu=1, data_dir=None,
     print(output_msg)
 
 
+def experiment_command(exp_name, thunk, seed=0, num_cpu=1, data_dir=None,
+                       datestamp=False, **kwargs):
+    """
+    Build the command line which runs one experiment in a fresh process.
+
+    Takes the same arguments as ``call_experiment``. Returns ``(cmd, kwargs)``:
+    the ``run_entrypoint.py`` command with the serialized thunk, and the
+    kwargs the thunk will be called with (``seed`` and ``logger_kwargs``
+    filled in).
+    """
+
+    # Determine number of CPU cores to run on
+    num_cpu = psutil.cpu_count(logical=False) if num_cpu=='auto' else num_cpu
+
+    # Send random seed to thunk
+    kwargs['seed'] = seed
+
+    # Set up logger output directory
+    if 'logger_kwargs' not in kwargs:
+        kwargs['logger_kwargs'] = setup_logger_kwargs(exp_name, seed, data_dir, datestamp)
+
+    def thunk_plus():
+        # Make 'env_fn' from 'env_name'
+        if 'env_name' in kwargs:
+            import gym
+            env_name = kwargs['env_name']
+            kwargs['env_fn'] = lambda : gym.make(env_name)
+            del kwargs['env_name']
+
+        # Fork into multiple processes
+        mpi_fork(num_cpu)
+
+        # Run thunk
+        thunk(**kwargs)
+
+    # Prepare to launch a script to run the experiment
+    pickled_thunk = cloudpickle.dumps(thunk_plus)
+    encoded_thunk = base64.b64encode(zlib.compress(pickled_thunk)).decode('utf-8')
+
+    entrypoint = osp.join(osp.abspath(osp.dirname(__file__)),'run_entrypoint.py')
+    cmd = [sys.executable if sys.executable else 'python', entrypoint, encoded_thunk]
+    return cmd, kwargs
+
+
 def all_bools(vals):
     return all([isinstance(v,bool) for v in vals])
 
@@ -477,7 +498,10 @@ class ExperimentGrid:
         new_variants = [unflatten_var(var) for var in flat_variants]
         return new_variants
 
-    def run(self, thunk, num_cpu=1, data_dir=None, datestamp=False):
+    def run(self, thunk, num_cpu=1, data_dir=None, datestamp=False,
+            num_parallel=1, num_threads=None, retries=0, fail_fast=False,
+            stream=False, cpu_budget=None, sweep_resume=False,
+            state_file=None, launcher='subprocess'):
         """
         Run each variant in the grid with function 'thunk'.
 
@@ -491,6 +515,48 @@ class ExperimentGrid:
         Maintenance note: the args for ExperimentGrid.run should track closely
         to the args for call_experiment. However, ``seed`` is omitted because
         we presume the user may add it as a parameter in the grid.
+
+        With ``num_parallel > 1``, a ``cpu_budget``, ``sweep_resume`` or the
+        warm ``launcher``, the
+        variants run on this machine through a ``LocalScheduler`` (see
+        ``spinup/utils/scheduler.py``), which takes the remaining args:
+
+        Args:
+            num_parallel (int): Maximum number of variants running at once
+                (None for no limit other than ``cpu_budget``).
+
+            num_threads (int): Torch/OpenMP threads per variant. Defaults to
+                an even share of the physical cores. Variants with
+                ``num_cpu > 1`` use one thread per rank.
+
+            retries (int): Reruns of a failed variant before skipping it.
+
+            fail_fast (bool): Stop launching variants after one has failed.
+
+            stream (bool): Echo each variant's output, prefixed with its
+                name. It always goes to ``<output_dir>/stdout.txt``.
+
+            cpu_budget (int): Cores the running variants may take in total,
+                at ``num_cpu`` times their threads per rank each.
+
+            sweep_resume (bool): Pick up a sweep that was interrupted. Variants
+                which finished (per the state file, and with their
+                ``progress.txt`` still there) are skipped. The others rerun
+                in their old output directories, and continue from their
+                newest checkpoint if they have one and ``thunk`` takes a
+                ``resume`` argument (like ``diayn`` and ``sac``). This is
+                separate from ``resume`` itself, which a grid may set like
+                any other parameter of ``thunk``.
+
+            state_file (string): Where the status of every variant is kept.
+                Defaults to ``<data_dir>/<grid name>_jobs.json``.
+
+            launcher (string): ``warm`` forks variants with ``num_cpu=1``
+                from a process which has already imported torch, gym and
+                the thunk's module, instead of starting a fresh interpreter
+                for each one (``subprocess``). Worth it for many short runs.
+                As with any ``multiprocessing`` code, a script using it
+                needs an ``if __name__ == '__main__':`` guard.
         """
 
         # Print info about self.
@@ -527,7 +593,17 @@ class ExperimentGrid:
             for _ in prog_bar:
                 time.sleep(wait/steps)
 
+        use_scheduler = num_parallel != 1 or cpu_budget is not None or sweep_resume \
+            or launcher != 'subprocess'
+        num_cpu = psutil.cpu_count(logical=False) if num_cpu=='auto' else num_cpu
+        if state_file is None:
+            state_file = osp.join(data_dir or DEFAULT_DATA_DIR,
+                                  (self._name or 'grid') + '_jobs.json')
+        saved = load_job_state(state_file) if sweep_resume else dict()
+
         # Run the variants.
+        jobs = []
+        preload = set()
         for var in variants:
             exp_name = self.variant_name(var)
 
@@ -542,8 +618,49 @@ class ExperimentGrid:
                 # Assume thunk is given as a function.
                 thunk_ = thunk
 
-            call_experiment(exp_name, thunk_, num_cpu=num_cpu, 
-                            data_dir=data_dir, datestamp=datestamp, **var)
+            if not use_scheduler:
+                call_experiment(exp_name, thunk_, num_cpu=num_cpu, 
+                                data_dir=data_dir, datestamp=datestamp, **var)
+                continue
+
+            seed = var.pop('seed', 0)
+            threads = num_threads if num_cpu == 1 else 1
+            if getattr(thunk_, '__module__', '__main__') != '__main__':
+                preload.add(thunk_.__module__)
+            prev = saved.get('%s_s%s' % (exp_name, seed))
+            if prev is not None:
+                # Rerun in the same place, so checkpoints and logs carry on
+                var['logger_kwargs'] = dict(output_dir=prev['output_dir'], exp_name=exp_name)
+                if is_complete(prev):
+                    job = Job(exp_name, None, prev['output_dir'], seed, num_cpu, threads)
+                    job.status, job.attempts, job.duration = \
+                        'done', prev['attempts'], prev['duration']
+                    jobs.append(job)
+                    continue
+                if latest_checkpoint(prev['output_dir']) is not None and \
+                        'resume' in inspect.signature(thunk_).parameters:
+                    var['resume'] = True
+            cmd, kwargs = experiment_command(exp_name, thunk_, seed, num_cpu,
+                                             data_dir, datestamp, **var)
+            jobs.append(Job(exp_name, cmd, kwargs['logger_kwargs']['output_dir'],
+                            seed, num_cpu, threads))
+
+        if jobs:
+            n_skipped = sum(job.status == 'done' for job in jobs)
+            if n_skipped:
+                print(colorize('Resuming sweep: skipping %d finished variants.' % n_skipped,
+                               color='cyan', bold=True))
+            scheduler = LocalScheduler(num_parallel, num_threads, retries,
+                                       fail_fast, stream, cpu_budget=cpu_budget,
+                                       state_file=state_file, launcher=launcher,
+                                       preload=sorted(preload))
+            try:
+                scheduler.run(jobs)
+            finally:
+                print_summary(jobs)
+            n_failed = sum(job.status != 'done' for job in jobs)
+            if n_failed:
+                raise RuntimeError('%d of %d experiments failed.' % (n_failed, len(jobs)))
 
 
 def test_eg():
@@ -0,0 +1,377 @@
+"""
+
+Run many experiments side by side on the local machine.
+
+``ExperimentGrid.run(..., num_parallel=K)`` hands its variants to a
+``LocalScheduler``, which keeps up to K of them running at once, each in its
+own ``run_entrypoint.py`` subprocess (see ``experiment_command``). Every job
+gets a fixed number of torch/OpenMP threads, so K jobs don't fight over the
+cores, and its output goes to ``<output_dir>/stdout.txt``. Failed jobs are
+retried, then skipped, and a summary table is printed at the end.
+
+With a ``cpu_budget``, jobs are packed by the cores they need instead: a job
+of ``num_cpu`` MPI ranks with ``num_threads`` threads each takes
+``num_cpu * num_threads`` cores, and waiting jobs are started, in order,
+whenever they fit in what is left. The status of every job is saved to a
+state file as the sweep goes, so that an interrupted sweep can be resumed
+(``ExperimentGrid.run(..., sweep_resume=True)``): finished variants are skipped,
+and the others restart, from their last checkpoint if they have one.
+
+Starting a fresh interpreter and importing torch, gym and dm_control takes
+seconds, which adds up over a grid of short runs. With
+``launcher="warm"``, single-process jobs are forked instead from a
+``forkserver`` process that has imported all of that once (see
+``WARM_PRELOAD``). Each job still gets a process of its own, so nothing
+leaks from one experiment to the next. The startup time of every job, from
+launch until its thunk starts, is shown in the summary either way.
+
+"""
+import base64
+import json
+import multiprocessing
+import os
+import os.path as osp
+import pickle
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+import psutil
+from diayn.spinningup.spinup.utils.logx import colorize
+
+DIV_LINE_WIDTH = 80
+
+# Environment variables that set the size of the thread pools of torch,
+# numpy's BLAS and OpenMP in a fresh process
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+# Modules the warm launcher's forkserver imports before forking any job
+WARM_PRELOAD = ["numpy", "torch", "gym", "cloudpickle"]
+
+# Printed by a job when its thunk is about to run (see run_entrypoint.py)
+STARTUP_MSG = "Experiment started after %.3f s"
+
+
+def _run_warm(encoded_thunk, log_path, num_threads, launch_time):
+    # Runs in a process forked from the forkserver: send the output to the
+    # job's log and run the thunk, as run_entrypoint.py would
+    fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    for k in THREAD_ENV_VARS:
+        os.environ[k] = str(num_threads)
+    if "torch" in sys.modules:
+        # torch was imported by the forkserver, before this was set
+        sys.modules["torch"].set_num_threads(num_threads)
+    thunk = pickle.loads(zlib.decompress(base64.b64decode(encoded_thunk)))
+    print(STARTUP_MSG % (time.time() - launch_time), flush=True)
+    thunk()
+
+
+class _WarmProcess:
+    """The part of the ``subprocess.Popen`` interface the scheduler uses."""
+
+    def __init__(self, ctx, *args):
+        self._proc = ctx.Process(target=_run_warm, args=args)
+        self._proc.start()
+
+    @property
+    def returncode(self):
+        return self._proc.exitcode
+
+    def poll(self):
+        return self._proc.exitcode
+
+    def terminate(self):
+        self._proc.terminate()
+
+    def wait(self):
+        self._proc.join()
+        return self._proc.exitcode
+
+
+class Job:
+    """
+    One experiment to run: a command and where its results go.
+
+    Attributes set while it runs: ``status`` (``pending``, ``running``,
+    ``done`` or ``failed``), ``attempts``, ``returncode`` and ``duration``
+    (seconds, of the last attempt).
+    """
+
+    def __init__(self, name, cmd, output_dir, seed=None, num_cpu=1, num_threads=None):
+        self.name = name
+        self.cmd = cmd
+        self.output_dir = output_dir
+        self.seed = seed
+        self.num_cpu = num_cpu
+        self.num_threads = num_threads
+        self.status = "pending"
+        self.attempts = 0
+        self.returncode = None
+        self.duration = None
+        self.startup = None
+        self._proc = None
+        self._pump = None
+        self._start = None
+
+    @property
+    def log_path(self):
+        return osp.join(self.output_dir, "stdout.txt")
+
+    @property
+    def label(self):
+        return self.name if self.seed is None else "%s_s%s" % (self.name, self.seed)
+
+    def state(self):
+        return dict(status=self.status, attempts=self.attempts, returncode=self.returncode,
+                    duration=self.duration, startup=self.startup, output_dir=self.output_dir)
+
+
+def load_job_state(fname):
+    """The saved state of every job of a sweep, by job label (empty if none)."""
+    if not osp.exists(fname):
+        return dict()
+    with open(fname) as f:
+        return json.load(f)
+
+
+def save_job_state(fname, jobs):
+    """Write the state of ``jobs`` to ``fname``, atomically."""
+    os.makedirs(osp.dirname(osp.abspath(fname)), exist_ok=True)
+    tmp = fname + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({job.label: job.state() for job in jobs}, f, indent=4)
+    os.replace(tmp, fname)
+
+
+def is_complete(job_state):
+    """Whether a saved job finished, and its results are still on disk."""
+    return (job_state.get("status") == "done"
+            and osp.exists(osp.join(job_state["output_dir"], "progress.txt")))
+
+
+class LocalScheduler:
+    """
+    Runs ``Job``s as subprocesses, at most ``num_parallel`` at a time.
+    """
+
+    def __init__(self, num_parallel=1, num_threads=None, retries=0,
+                 fail_fast=False, stream=False, poll_interval=0.5,
+                 cpu_budget=None, state_file=None, launcher="subprocess",
+                 preload=None):
+        """
+        Args:
+            num_parallel (int): Maximum number of jobs running at once.
+                None for no limit other than ``cpu_budget``.
+
+            num_threads (int): Torch/OpenMP threads per rank of a job that
+                doesn't set its own. Defaults to an even share of the
+                physical cores between ``num_parallel`` jobs (1 if it is
+                None). Jobs with ``num_cpu > 1`` should use 1: ``mpi_fork``
+                runs their ranks with one thread each.
+
+            retries (int): How many times to rerun a failed job before
+                giving up on it.
+
+            fail_fast (bool): Stop launching new jobs once one has failed
+                for good. Jobs already running are left to finish.
+
+            stream (bool): Also echo every job's output to stdout, each
+                line prefixed with the job's name.
+
+            cpu_budget (int): Number of cores the running jobs may take in
+                total (see ``cores``). A job which needs more than the whole
+                budget runs alone.
+
+            state_file (string): Where to keep the state of every job,
+                updated whenever it changes (see ``save_job_state``).
+
+            launcher (string): ``subprocess`` starts each job with a fresh
+                ``run_entrypoint.py``. ``warm`` forks single-process jobs
+                from a forkserver with ``preload`` already imported (MPI
+                jobs still get a fresh interpreter).
+
+            preload (list): Modules for the warm launcher to import, on top
+                of ``WARM_PRELOAD``. Typically the module of the thunk.
+        """
+        self.num_parallel = num_parallel
+        cores = psutil.cpu_count(logical=False) or os.cpu_count()
+        self.num_threads = num_threads or max(cores // (num_parallel or cores), 1)
+        self.retries = retries
+        self.fail_fast = fail_fast
+        self.stream = stream
+        self.poll_interval = poll_interval
+        self.cpu_budget = cpu_budget
+        self.state_file = state_file
+        self.launcher = launcher
+        self._ctx = None
+        if launcher == "warm":
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(WARM_PRELOAD + list(preload or []))
+
+    def threads(self, job):
+        return job.num_threads or self.num_threads
+
+    def cores(self, job):
+        """Cores taken by ``job``: one per thread of each of its ranks."""
+        return job.num_cpu * self.threads(job)
+
+    def _job_env(self, job):
+        env = dict(os.environ)
+        for k in THREAD_ENV_VARS:
+            env[k] = str(self.threads(job))
+        env["SPINUP_LAUNCH_TIME"] = repr(job._start)
+        return env
+
+    def _handle_line(self, job, line):
+        if line.startswith(STARTUP_MSG.split("%")[0].encode()) and job.startup is None:
+            job.startup = float(line.split()[-2])
+        if self.stream:
+            prefix = colorize("[%s] " % job.label, "cyan")
+            sys.stdout.write(prefix + line.decode(errors="replace"))
+            sys.stdout.flush()
+
+    def _pump_output(self, job, log):
+        # Copy the job's output to its log file
+        for line in iter(job._proc.stdout.readline, b""):
+            log.write(line)
+            log.flush()
+            self._handle_line(job, line)
+        log.close()
+
+    def _follow_log(self, job, log):
+        # Warm jobs write their log themselves, read it as it grows
+        while True:
+            done = job._proc.poll() is not None
+            line = log.readline()
+            if line:
+                self._handle_line(job, line)
+            elif done:
+                break
+            else:
+                time.sleep(0.1)
+        log.close()
+
+    def _launch(self, job):
+        os.makedirs(job.output_dir, exist_ok=True)
+        job.attempts += 1
+        job.startup = None
+        with open(job.log_path, "ab") as log:
+            log.write(("\n==> attempt %d: %s\n\n" % (job.attempts, time.ctime())).encode())
+            offset = log.tell()
+        job._start = time.time()
+        if self._ctx is not None and job.num_cpu == 1:
+            job._proc = _WarmProcess(self._ctx, job.cmd[-1], job.log_path,
+                                     self.threads(job), job._start)
+            log = open(job.log_path, "rb")
+            log.seek(offset)
+            pump = self._follow_log
+        else:
+            job._proc = subprocess.Popen(job.cmd, env=self._job_env(job),
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            log = open(job.log_path, "ab")
+            pump = self._pump_output
+        job._pump = threading.Thread(target=pump, args=(job, log), daemon=True)
+        job._pump.start()
+        job.status = "running"
+        print(colorize("Started %s (attempt %d), logging to %s"
+                       % (job.label, job.attempts, job.log_path), "green"))
+
+    def _finish(self, job):
+        job._pump.join()
+        job.returncode = job._proc.returncode
+        job.duration = time.time() - job._start
+        job._proc = job._pump = None
+        if job.returncode == 0:
+            job.status = "done"
+            print(colorize("Finished %s in %.0fs" % (job.label, job.duration), "green"))
+        elif job.attempts <= self.retries:
+            job.status = "pending"
+            print(colorize("%s failed with exit code %d, retrying"
+                           % (job.label, job.returncode), "yellow"))
+        else:
+            job.status = "failed"
+            print(colorize("%s failed with exit code %d, see %s"
+                           % (job.label, job.returncode, job.log_path), "red", bold=True))
+
+    def _can_launch(self, job, running):
+        if self.num_parallel is not None and len(running) >= self.num_parallel:
+            return False
+        if self.cpu_budget is None or not running:
+            return True
+        used = sum(self.cores(other) for other in running)
+        return used + self.cores(job) <= self.cpu_budget
+
+    def run(self, jobs):
+        """
+        Run ``jobs`` until each one has finished or failed for good.
+
+        On ``KeyboardInterrupt`` the running jobs are terminated. Returns
+        ``jobs``, with their final status.
+        """
+        pending = [job for job in jobs if job.status == "pending"]
+        running = []
+        stop = False
+        try:
+            while running or (pending and not stop):
+                # Start every waiting job that fits, in order
+                for job in list(pending):
+                    if stop or not self._can_launch(job, running):
+                        continue
+                    pending.remove(job)
+                    self._launch(job)
+                    running.append(job)
+                self._on_update(jobs)
+
+                time.sleep(self.poll_interval)
+                for job in list(running):
+                    if job._proc.poll() is None:
+                        continue
+                    running.remove(job)
+                    self._finish(job)
+                    if job.status == "pending":
+                        # retry before moving on to new variants
+                        pending.insert(0, job)
+                    elif job.status == "failed" and self.fail_fast:
+                        stop = True
+                self._on_update(jobs)
+        except KeyboardInterrupt:
+            for job in running:
+                job._proc.terminate()
+            for job in running:
+                job._proc.wait()
+                job._pump.join()
+                job.status = "failed"
+            raise
+        finally:
+            self._on_update(jobs)
+        return jobs
+
+    def _on_update(self, jobs):
+        if self.state_file is not None:
+            save_job_state(self.state_file, jobs)
+
+
+def print_summary(jobs):
+    """Print one line per job: its status, attempts, run time and log file."""
+    print("=" * DIV_LINE_WIDTH)
+    width = max([len(job.label) for job in jobs] + [10])
+    print("%s  %-8s %8s %10s %11s  %s" % ("Experiment".ljust(width), "Status", "Attempts",
+                                          "Time (s)", "Startup (s)", "Log"))
+    colors = dict(done="green", failed="red", pending="yellow", running="yellow")
+    for job in jobs:
+        duration = "%.0f" % job.duration if job.duration is not None else "-"
+        startup = "%.2f" % job.startup if job.startup is not None else "-"
+        print("%s  %s %8d %10s %11s  %s" % (job.label.ljust(width),
+                                             colorize(job.status.ljust(8), colors[job.status]),
+                                             job.attempts, duration, startup, job.log_path))
+    n_done = sum(job.status == "done" for job in jobs)
+    print("\n%d of %d experiments finished." % (n_done, len(jobs)))
+    startups = [job.startup for job in jobs if job.startup is not None]
+    if startups:
+        print("Startup time per experiment: %.2f s on average." % (sum(startups) / len(startups)))
+    print("=" * DIV_LINE_WIDTH)
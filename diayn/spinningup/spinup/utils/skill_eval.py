@@ -0,0 +1,172 @@
+"""
+
+Batched evaluation of the skills of a saved DIAYN agent.
+
+Every (skill, episode) pair gets its own env and all of them are stepped in
+lockstep, so each step costs one policy forward (and one discriminator
+forward) over the whole batch instead of one per skill. The result is a
+per-skill table, which makes it cheap to score many checkpoints offline:
+
+.. code-block:: python
+
+    env_fn = lambda episode: dmc2gym.make(domain_name='walker', task_name='walk', seed=episode)
+    table = evaluate_checkpoint('data/diayn/diayn_s0', env_fn, num_episodes=5)
+
+"""
+import json
+import os.path as osp
+
+import gym
+import dmc2gym
+import numpy as np
+import pandas as pd
+import torch
+from diayn.spinningup.spinup.utils.test_policy import load_pytorch_model, resolve_itr
+
+
+def evaluate_skills(model, env_fn, n_skill, skills=None, num_episodes=1,
+                    max_ep_len=1000, deterministic=True):
+    """
+    Roll out ``num_episodes`` episodes of each skill with one batched forward per step.
+
+    Args:
+        model: A DIAYN ``MLPActorCritic`` (needs ``act`` and ``di``).
+
+        env_fn : A function which creates a copy of the environment for
+            the episode index it is given (0 to ``num_episodes - 1``). Seed
+            the env from that index: every skill then plays the same set of
+            distinct episodes, and so does every checkpoint.
+
+        n_skill (int): Number of skills the model was trained with.
+
+        skills (list): Skills to evaluate. Defaults to all of them.
+
+    Returns:
+        A ``pandas.DataFrame`` with one row per skill: mean/std episode
+        return, mean episode length, mean discriminator probability of the
+        played skill (``AverageDiProbS``), how often the discriminator's
+        top guess is the played skill (``DiAccuracy``), and state-visitation
+        stats over every visited observation: per-dimension ``StateMean``
+        and ``StateStd`` vectors and their average spread ``StateSpread``.
+    """
+    skills = list(range(n_skill)) if skills is None else list(skills)
+    lane_skill = np.repeat(skills, num_episodes)
+    envs = [env_fn(episode) for _ in skills for episode in range(num_episodes)]
+    sk = torch.as_tensor(np.eye(n_skill)[lane_skill], dtype=torch.float32)
+
+    obs = np.stack([env.reset() for env in envs]).astype(np.float32)
+    n_lanes, obs_dim = obs.shape
+    ep_ret = np.zeros(n_lanes)
+    ep_len = np.zeros(n_lanes, dtype=np.int64)
+    di_prob = np.zeros(n_lanes)
+    di_hits = np.zeros(n_lanes)
+    obs_sum = np.zeros((n_lanes, obs_dim))
+    obs_sqsum = np.zeros((n_lanes, obs_dim))
+
+    # Lanes drop out of the batch as their episodes end
+    active = np.arange(n_lanes)
+    while len(active) > 0:
+        o = obs[active]
+        obs_sum[active] += o
+        obs_sqsum[active] += np.square(o, dtype=np.float64)
+
+        x = torch.as_tensor(o)
+        with torch.no_grad():
+            p = model.di(x).softmax(-1).numpy()
+        a = model.act(sk[active], x, deterministic)
+        played = lane_skill[active]
+        di_prob[active] += p[np.arange(len(active)), played]
+        di_hits[active] += p.argmax(-1) == played
+
+        still_active = []
+        for j, i in enumerate(active):
+            obs[i], r, d, _ = envs[i].step(a[j])
+            ep_ret[i] += r
+            ep_len[i] += 1
+            if not (d or ep_len[i] == max_ep_len):
+                still_active.append(i)
+        active = np.array(still_active, dtype=np.int64)
+
+    for env in envs:
+        env.close()
+
+    rows = []
+    for skill in skills:
+        lanes = lane_skill == skill
+        n = ep_len[lanes].sum()
+        mean = obs_sum[lanes].sum(0) / n
+        std = np.sqrt(np.maximum(obs_sqsum[lanes].sum(0) / n - mean ** 2, 0))
+        rows.append(dict(
+            Skill=skill,
+            AverageEpRet=ep_ret[lanes].mean(),
+            StdEpRet=ep_ret[lanes].std(),
+            EpLen=ep_len[lanes].mean(),
+            AverageDiProbS=di_prob[lanes].sum() / n,
+            DiAccuracy=di_hits[lanes].sum() / n,
+            StateSpread=std.mean(),
+            StateMean=mean,
+            StateStd=std,
+        ))
+    return pd.DataFrame(rows)
+
+
+def evaluate_checkpoint(fpath, env_fn, itr="last", **kwargs):
+    """
+    Load the model saved in ``fpath`` and run ``evaluate_skills`` on it.
+
+    ``n_skill`` is read from the run's ``config.json``; other keyword
+    arguments are passed on to ``evaluate_skills``.
+    """
+    with open(osp.join(fpath, "config.json")) as f:
+        n_skill = json.load(f)["n_skill"]
+    model = load_pytorch_model(fpath, resolve_itr(fpath, itr))
+    return evaluate_skills(model, env_fn, n_skill, **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fpaths", nargs="+")
+    parser.add_argument("--env_id", type=str)
+    parser.add_argument("--domain_name", type=str)
+    parser.add_argument("--task_name", type=str)
+    parser.add_argument("--len", "-l", type=int, default=1000)
+    parser.add_argument("--episodes", "-n", type=int, default=1)
+    parser.add_argument("--skills", "-sk", type=int, nargs="*", default=None)
+    parser.add_argument("--itr", "-i", type=int, default=-1)
+    parser.add_argument("--stochastic", action="store_true")
+    parser.add_argument("--seed", "-s", type=int, default=0)
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="Write the combined table of all checkpoints to this CSV file.")
+    args = parser.parse_args()
+
+    assert args.env_id or (
+        args.domain_name and args.task_name
+    ), "Can't create environment"
+    def env_fn(episode):
+        if args.env_id:
+            env = gym.make(args.env_id)
+            env.seed(args.seed + episode)
+            return env
+        return dmc2gym.make(
+            domain_name=args.domain_name, task_name=args.task_name, seed=args.seed + episode
+        )
+
+    tables = []
+    for fpath in args.fpaths:
+        table = evaluate_checkpoint(
+            fpath,
+            env_fn,
+            args.itr if args.itr >= 0 else "last",
+            skills=args.skills,
+            num_episodes=args.episodes,
+            max_ep_len=args.len,
+            deterministic=not args.stochastic,
+        )
+        table.insert(0, "Checkpoint", fpath)
+        tables.append(table)
+        print(table.drop(columns=["StateMean", "StateStd"]).to_string(index=False))
+
+    if args.output:
+        pd.concat(tables).drop(columns=["StateMean", "StateStd"]).to_csv(args.output, index=False)
@@ -2,19 +2,54 @@ import time
 import joblib
 import os
 import os.path as osp
+import re
 
 # import tensorflow as tf
 import torch
 import json
 import numpy as np
-from diayn.spinningup.spinup.utils.logx import EpochLogger
+from diayn.spinningup.spinup.utils.logx import EpochLogger, restore_pytorch_model
+from diayn.spinningup.spinup.utils.video import VideoWriter
 import gym
 import dmc2gym
-from PIL import Image, ImageDraw, ImageFont
 
 # from diayn.spinningup.spinup.utils.logx import restore_tf_graph
 
 
+def resolve_itr(fpath, itr="last", backend="pytorch"):
+    """
+    Turn ``itr`` (an int or 'last') into the suffix of a saved model name.
+
+    'last' picks the highest numbered save, or the unnumbered one if there
+    are none.
+    """
+    if itr == "last":
+        # check filenames for epoch (AKA iteration) numbers, find maximum value
+
+        if backend == "tf1":
+            saves = [
+                int(x[8:]) for x in os.listdir(fpath) if "tf1_save" in x and len(x) > 8
+            ]
+
+        elif backend == "pytorch":
+            pytsave_path = osp.join(fpath, "pyt_save")
+            # Saves are named 'modelXX.pt', where 'XX' is either an integer or
+            # empty. Only the numbered ones count: the folder also holds
+            # 'model.json' and the '.tmp*' files of unfinished saves.
+            saves = [
+                int(m.group(1))
+                for m in map(re.compile(r"^model(\d+)\.pt$").match, os.listdir(pytsave_path))
+                if m
+            ]
+
+        return "%d" % max(saves) if len(saves) > 0 else ""
+
+    assert isinstance(
+        itr, int
+    ), "Bad value provided for itr (needs to be int or 'last')."
+    return "%d" % itr
+
+
 def load_policy_and_env(fpath, itr="last", skill=None, deterministic=False):
     """
     Load a policy from save, whether it's TF or PyTorch, along with RL env.
@@ -34,32 +69,7 @@ def load_policy_and_env(fpath, itr="last", skill=None, deterministic=False):
         backend = "pytorch"
 
     # handle which epoch to load from
-    if itr == "last":
-        # check filenames for epoch (AKA iteration) numbers, find maximum value
-
-        if backend == "tf1":
-            saves = [
-                int(x[8:]) for x in os.listdir(fpath) if "tf1_save" in x and len(x) > 8
-            ]
-
-        elif backend == "pytorch":
-            pytsave_path = osp.join(fpath, "pyt_save")
-            # Each file in this folder has naming convention 'modelXX.pt', where
-            # 'XX' is either an integer or empty string. Empty string case
-            # corresponds to len(x)==8, hence that case is excluded.
-            saves = [
-                int(x.split(".")[0][5:])
-                for x in os.listdir(pytsave_path)
-                if len(x) > 8 and "model" in x
-            ]
-
-        itr = "%d" % max(saves) if len(saves) > 0 else ""
-
-    else:
-        assert isinstance(
-            itr, int
-        ), "Bad value provided for itr (needs to be int or 'last')."
-        itr = "%d" % itr
+    itr = resolve_itr(fpath, itr, backend)
 
     if skill is not None:
         fname = osp.join(fpath, "config.json")
@@ -112,14 +122,27 @@ def load_tf_policy(fpath, itr, deterministic=False):
     return get_action
 
 
-def load_pytorch_policy(fpath, itr, skill=None, deterministic=False):
-    """Load a pytorch policy saved with Spinning Up Logger."""
+def load_pytorch_model(fpath, itr):
+    """
+    Load the pytorch module saved with Spinning Up Logger.
+
+    Weights-only saves (with a ``model.json`` spec) are rebuilt and
+    memory-mapped; otherwise the pickled module is loaded.
+    """
 
     fname = osp.join(fpath, "pyt_save", "model" + itr + ".pt")
     print("\n\nLoading from %s.\n\n" % fname)
 
-    model = torch.load(fname)
-    
+    if osp.exists(osp.join(fpath, "pyt_save", "model.json")):
+        return restore_pytorch_model(osp.join(fpath, "pyt_save"), itr)
+    return torch.load(fname)
+
+
+def load_pytorch_policy(fpath, itr, skill=None, deterministic=False):
+    """Load a pytorch policy saved with Spinning Up Logger."""
+
+    model = load_pytorch_model(fpath, itr)
+
     if skill is not None:
         def get_action(x):
             with torch.no_grad():
@@ -148,25 +171,24 @@ def run_policy(env, get_action, skill, max_ep_len=None, num_episodes=100, render
         + "page on Experiment Outputs for how to handle this situation."
     )
 
+    # Frames of all episodes go to save_dir/<skill>/<skill>.mp4, encoded on
+    # a background thread so rollouts don't wait on the disk
+    writer = None
+    if save_dir:
+        vid_path = os.path.join(save_dir, str(skill))
+        os.makedirs(vid_path, exist_ok=True)
+        fps = env.metadata.get("video.frames_per_second", 50)
+        writer = VideoWriter(os.path.join(vid_path, f"{skill}.mp4"), fps=fps, label=skill)
+
     logger = EpochLogger()
     o, r, d, ep_ret, ep_len, n = env.reset(), 0, False, 0, 0, 0
     while n < num_episodes:
-        if render or save_dir:
+        if render or writer:
             img = env.render(mode=("human" if render else "rgb_array"))
             if render:
                 time.sleep(1.5e-2)
-            if save_dir:
-                ims_path = os.path.join(save_dir, str(args.skill))
-                os.makedirs(ims_path, exist_ok=True)
-
-                im = Image.fromarray(img).convert('RGB')
-                draw = ImageDraw.Draw(im)
-                # font = ImageFont.truetype("arial.ttf", 24)
-                font = ImageFont.truetype("/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf", 28, encoding="unic")
-                draw.text((20,20), str(skill), font=font, fill=(255,255,255))
-
-                frame_fpath = os.path.join(ims_path, f"{n:02d}_{ep_len:03}.jpg")
-                im.save(frame_fpath)
+            if writer:
+                writer.write(img)
 
         a = get_action(o)
         o, r, d, _ = env.step(a)
@@ -179,6 +201,9 @@ def run_policy(env, get_action, skill, max_ep_len=None, num_episodes=100, render
             o, r, d, ep_ret, ep_len = env.reset(), 0, False, 0, 0
             n += 1
 
+    if writer:
+        writer.close()
+
     logger.log_tabular("EpRet", with_min_and_max=True)
     logger.log_tabular("EpLen", average_only=True)
     logger.dump_tabular()
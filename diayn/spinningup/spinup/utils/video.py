@@ -0,0 +1,114 @@
+import queue
+import subprocess
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_PATH = "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf"
+
+_fonts = dict()
+
+
+def get_font(size=28):
+    """Load the label font once per size (falls back to PIL's default font)."""
+    if size not in _fonts:
+        try:
+            _fonts[size] = ImageFont.truetype(FONT_PATH, size, encoding="unic")
+        except OSError:
+            _fonts[size] = ImageFont.load_default()
+    return _fonts[size]
+
+
+def draw_label(img, label, font_size=28):
+    """Return a copy of an RGB frame with ``label`` drawn in its top-left corner."""
+    im = Image.fromarray(img).convert('RGB')
+    draw = ImageDraw.Draw(im)
+    draw.text((20, 20), str(label), font=get_font(font_size), fill=(255, 255, 255))
+    return np.asarray(im)
+
+
+class VideoWriter:
+    """
+    Encodes RGB frames to an MP4 file on a background thread.
+
+    Frames are piped as raw video into an ``ffmpeg`` process, so the caller
+    only pays for copying the frame into a queue. At most ``max_queue``
+    frames wait to be labeled and encoded before ``write`` blocks. An error
+    in the encoder (e.g. no ``ffmpeg`` binary) is raised by the next call
+    to ``write`` or ``close``.
+
+    Example:
+
+    .. code-block:: python
+
+        writer = VideoWriter('skill_3.mp4', fps=50, label=3)
+        for img in frames:
+            writer.write(img)
+        writer.close()
+    """
+
+    def __init__(self, fname, fps=50, label=None, max_queue=256):
+        self.fname = fname
+        self.fps = fps
+        self.label = label
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._proc = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _open(self, height, width):
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', '%dx%d' % (width, height), '-framerate', str(self.fps),
+               '-i', '-', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', self.fname]
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def _run(self):
+        try:
+            while True:
+                img = self._queue.get()
+                if img is None:
+                    break
+                if self.label is not None:
+                    img = draw_label(img, self.label)
+                if self._proc is None:
+                    self._proc = self._open(*img.shape[:2])
+                self._proc.stdin.write(np.ascontiguousarray(img, dtype=np.uint8).tobytes())
+        except Exception as e:
+            self._error = e
+        finally:
+            if self._proc is not None:
+                try:
+                    self._proc.stdin.close()
+                except OSError:
+                    pass    # broken pipe: ffmpeg is gone, its exit code says why
+                returncode = self._proc.wait()
+                if returncode != 0 and self._error is None:
+                    self._error = RuntimeError('ffmpeg exited with code %d.' % returncode)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('Encoding %s failed.' % self.fname) from error
+
+    def write(self, img):
+        """Queue a (height, width, 3) uint8 frame for encoding."""
+        self._raise_error()
+        img = np.array(img, copy=True)
+        while True:
+            try:
+                self._queue.put(img, timeout=1)
+                return
+            except queue.Full:
+                if not self._thread.is_alive():
+                    self._raise_error()
+                    raise RuntimeError('Video writer for %s stopped unexpectedly.' % self.fname)
+
+    def close(self):
+        """Flush the queued frames and wait for the MP4 file to be finalized."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
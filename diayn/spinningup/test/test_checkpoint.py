@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+import torch
+import numpy as np
+from dmc2gym.wrappers import DMCWrapper, FrameStack
+
+from diayn.spinningup.spinup.algos.pytorch.diayn.diayn import diayn
+from diayn.spinningup.spinup.algos.pytorch.sac.sac import sac
+from diayn.spinningup.spinup.utils.checkpoint import (
+    CheckpointWriter, atomic_torch_save, get_env_state, set_env_state)
+
+
+def env_fn():
+    return DMCWrapper('walker', 'walk', task_kwargs={'random': 1}, visualize_reward=False)
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def check_resume(self, algo, **kwargs):
+        ''' N epochs, then resume to 2N: same log and weights as 2N in one go '''
+        # checkpoint_freq=3: the run that stops at epoch 2 is only
+        # checkpointed because that is its last epoch
+        kwargs.update(ac_kwargs=dict(hidden_sizes=(32, 32)), steps_per_epoch=100,
+                      start_steps=50, update_after=50, num_test_episodes=1, max_ep_len=50,
+                      checkpoint_freq=3)
+        full, split = osp.join(self.tmp, 'full'), osp.join(self.tmp, 'split')
+        algo(env_fn, epochs=4, logger_kwargs=dict(output_dir=full), **kwargs)
+        algo(env_fn, epochs=2, logger_kwargs=dict(output_dir=split), **kwargs)
+        first_half = pd.read_table(osp.join(split, 'progress.txt'))
+        algo(env_fn, epochs=4, logger_kwargs=dict(output_dir=split), resume=True, **kwargs)
+
+        a = pd.read_table(osp.join(full, 'progress.txt'))
+        b = pd.read_table(osp.join(split, 'progress.txt'))
+        self.assertEqual(len(a), 4)
+        pd.testing.assert_frame_equal(a.drop(columns='Time'), b.drop(columns='Time'))
+        # the first epochs were kept, not rerun from scratch
+        pd.testing.assert_frame_equal(first_half, b[:2])
+
+        wa = torch.load(osp.join(full, 'pyt_save', 'model.pt'))
+        wb = torch.load(osp.join(split, 'pyt_save', 'model.pt'))
+        self.assertEqual(wa.keys(), wb.keys())
+        for k in wa:
+            self.assertTrue(torch.equal(wa[k], wb[k]), k)
+
+    def test_diayn(self):
+        self.check_resume(diayn, n_skill=4)
+
+    def test_sac(self):
+        self.check_resume(sac)
+
+
+class TestEnvState(unittest.TestCase):
+    def test_frame_stack(self):
+        ''' A restored env continues with the same stacked frames '''
+        env = FrameStack(env_fn(), 3)
+        env.reset()
+        actions = [env.action_space.sample() for _ in range(4)]
+        for a in actions[:2]:
+            env.step(a)
+        state = get_env_state(env)
+        obs = [env.step(a)[0] for a in actions[2:]]
+        env.reset()
+        set_env_state(env, state)
+        for o, a in zip(obs, actions[2:]):
+            np.testing.assert_array_equal(env.step(a)[0], o)
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def saved_epochs(self, writer):
+        return sorted(int(x[5:-3]) for x in os.listdir(writer.state_dir))
+
+    def test_pruning(self):
+        ''' keep_last newest checkpoints, plus every multiple of keep_every '''
+        writer = CheckpointWriter(self.tmp, keep_last=2, keep_every=3)
+        for epoch in range(1, 9):
+            writer.save(dict(epoch=epoch), epoch)
+            writer.wait()
+        writer.close()
+        self.assertEqual(self.saved_epochs(writer), [3, 6, 7, 8])
+
+        writer = CheckpointWriter(osp.join(self.tmp, 'last'), keep_last=1)
+        for epoch in range(5):
+            writer.save(dict(epoch=epoch), epoch)
+        writer.close()
+        self.assertEqual(self.saved_epochs(writer), [4])
+
+    def test_failed_save_keeps_previous_file(self):
+        fname = osp.join(self.tmp, 'state.pt')
+        atomic_torch_save(dict(x=1), fname)
+        with self.assertRaises(Exception):
+            atomic_torch_save(dict(x=lambda: None), fname)   # can't be pickled
+        self.assertEqual(torch.load(fname), dict(x=1))
+        self.assertEqual(os.listdir(self.tmp), ['state.pt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+import torch
+
+from diayn.spinningup.spinup.algos.pytorch.diayn.diayn import FrameStackReplayBuffer
+
+
+def fill(buf, k, frame_shape, n_episodes):
+    ''' Store short episodes of numbered frames; returns each transition's stacks '''
+    rng = np.random.RandomState(0)
+    next_frame = 0
+    stacks = {}     # transition id -> (obs, obs2)
+
+    def new_frame():
+        nonlocal next_frame
+        next_frame += 1
+        return np.full(frame_shape, next_frame, dtype=np.uint8)
+
+    # Short episodes (some shorter than the stack)
+    for ep in range(n_episodes):
+        frames = [new_frame()] * k   # reset frame repeated, like the env
+        obs = np.concatenate(frames)
+        for t in range(rng.randint(1, 6)):
+            frames = frames[1:] + [new_frame()]
+            obs2 = np.concatenate(frames)
+            transition = len(stacks)
+            buf.store(np.eye(2)[ep % 2], obs, [transition], 0, 0, 0, obs2, False, first=t == 0)
+            stacks[transition] = (obs, obs2)
+            obs = obs2
+    return stacks
+
+
+class TestFrameStackReplayBuffer(unittest.TestCase):
+    k, frame_shape = 3, (1, 2, 2)
+
+    def make_buffer(self):
+        return FrameStackReplayBuffer(sk_dim=2, obs_dim=(self.k,) + self.frame_shape[1:],
+                                      act_dim=1, size=20, frame_stack=self.k)
+
+    def test_sampled_stacks_match_stored(self):
+        ''' Stacks rebuilt at sample time equal the ones the env produced '''
+        buf = self.make_buffer()
+        stacks = fill(buf, self.k, self.frame_shape, 25)    # well past capacity
+
+        # Every sample is a transition whose frames are all still stored
+        batch = buf.sample_batch(500)
+        sampled = batch['act'][:, 0].numpy().astype(int)
+        for i, transition in enumerate(sampled):
+            obs, obs2 = stacks[transition]
+            np.testing.assert_array_equal(batch['obs'][i].numpy(), obs)
+            np.testing.assert_array_equal(batch['obs2'][i].numpy(), obs2)
+
+        # Only recent transitions are sampled, and not just a few of them
+        self.assertGreater(sampled.min(), len(stacks) - buf.max_size)
+        self.assertGreater(len(set(sampled)), 5)
+
+    def test_state_dict(self):
+        ''' A buffer restored from a checkpoint samples and stores like the original '''
+        buf, restored = self.make_buffer(), self.make_buffer()
+        fill(buf, self.k, self.frame_shape, 8)
+        restored.load_state_dict(buf.state_dict())
+        for b in (buf, restored):
+            b.store(np.eye(2)[0], np.zeros((self.k, 2, 2)), [-1], 0, 0, 0,
+                    np.ones((self.k, 2, 2)), False, first=True)
+        np.random.seed(0)
+        a = buf.sample_batch(50)
+        np.random.seed(0)
+        b = restored.sample_batch(50)
+        for key in a:
+            self.assertTrue(torch.equal(a[key], b[key]), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
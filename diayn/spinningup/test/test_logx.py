@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from diayn.spinningup.spinup.utils.logx import EpochLogger
+from diayn.spinningup.spinup.utils.mpi_tools import mpi_statistics_batch
+
+
+def reference_statistics(x, with_min_and_max=False):
+    ''' The per-key statistics, computed as mpi_statistics_scalar used to '''
+    x = np.array(x, dtype=np.float32)
+    mean = np.sum(x) / len(x)
+    std = np.sqrt(np.sum((x - mean)**2) / len(x))
+    if with_min_and_max:
+        return (mean, std, np.min(x) if len(x) > 0 else np.inf,
+                np.max(x) if len(x) > 0 else -np.inf)
+    return mean, std
+
+
+class TestStatistics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.xs = [
+            rng.normal(5, 3, size=1000),
+            rng.normal(100, 0.1, size=57),
+            [2.5],
+            np.arange(10),
+            [],
+        ]
+
+    def test_batch_matches_per_key(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for mm in (False, True, [True, False, True, False, True]):
+                flags = mm if isinstance(mm, list) else [mm] * len(self.xs)
+                stats = mpi_statistics_batch(self.xs, mm)
+                self.assertEqual(len(stats), len(self.xs))
+                for x, flag, s in zip(self.xs, flags, stats):
+                    np.testing.assert_allclose(s, reference_statistics(x, flag),
+                                               rtol=1e-5, equal_nan=True)
+
+    def test_epoch_logger(self):
+        ''' Deferred stats land in the right columns, in logging order '''
+        out = tempfile.mkdtemp()
+        try:
+            logger = EpochLogger(output_dir=out)
+            for x in self.xs[0]:
+                logger.store(A=x)
+            logger.store(B=np.asarray(self.xs[1]))      # one array of samples
+            for x in self.xs[3]:
+                logger.store(C=x)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                logger.log_tabular('Epoch', 1)
+                logger.log_tabular('A', with_min_and_max=True)
+                logger.log_tabular('B')
+                logger.log_tabular('C', average_only=True)
+                logger.log_tabular('D', with_min_and_max=True)     # nothing stored
+                logger.dump_tabular()
+            row = pd.read_table(osp.join(out, 'progress.txt')).iloc[0]
+        finally:
+            shutil.rmtree(out)
+
+        self.assertEqual(list(row.index), [
+            'Epoch', 'AverageA', 'StdA', 'MaxA', 'MinA', 'AverageB', 'StdB',
+            'C', 'AverageD', 'StdD', 'MaxD', 'MinD'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean, std, lo, hi = reference_statistics(self.xs[0], True)
+            np.testing.assert_allclose(row[['AverageA', 'StdA', 'MinA', 'MaxA']], [mean, std, lo, hi], rtol=1e-5)
+            np.testing.assert_allclose(row[['AverageB', 'StdB']], reference_statistics(self.xs[1]), rtol=1e-5)
+            np.testing.assert_allclose(row['C'], reference_statistics(self.xs[3])[0], rtol=1e-5)
+            np.testing.assert_allclose(row[['AverageD', 'StdD', 'MinD', 'MaxD']],
+                                       reference_statistics([], True), equal_nan=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import os
 import uuid
 
 import cv2
+import mujoco
+import numpy as np
 from dm_control.utils import io as resources
 from lxml import etree
 
@@ -35,6 +37,38 @@ def get_model_and_assets(model_filename="a1.xml"):
     return etree.tostring(mjcf, pretty_print=True), _ALL_ASSETS
 
 
+def get_control_state(env):
+    """
+    Snapshot a ``control.Environment`` so it can continue bit-identically.
+
+    Keeps MuJoCo's full integration state (time, qpos, qvel, act, warmstart,
+    controls, ...), the task's random state and the episode step counter.
+    """
+    physics = env.physics
+    spec = mujoco.mjtState.mjSTATE_INTEGRATION
+    physics_state = np.empty(mujoco.mj_stateSize(physics.model.ptr, spec))
+    mujoco.mj_getState(physics.model.ptr, physics.data.ptr, physics_state, spec)
+    return dict(
+        physics=physics_state,
+        random=env.task.random.get_state(),
+        step_count=env._step_count,
+        reset_next_step=env._reset_next_step,
+    )
+
+
+def set_control_state(env, state):
+    """Restore a snapshot taken with ``get_control_state``."""
+    physics = env.physics
+    mujoco.mj_setState(
+        physics.model.ptr, physics.data.ptr, state["physics"],
+        mujoco.mjtState.mjSTATE_INTEGRATION
+    )
+    physics.forward()
+    env.task.random.set_state(state["random"])
+    env._step_count = state["step_count"]
+    env._reset_next_step = state["reset_next_step"]
+
+
 class OpenCVImageViewer:
     """A simple OpenCV highgui based dm_control image viewer
 
@@ -1,5 +1,8 @@
+import math
+
 import gym
 from gym.envs.registration import register
+from gym.wrappers import TimeLimit
 
 
 def make(
@@ -15,38 +18,73 @@ def make(
         episode_length=1000,
         environment_kwargs=None,
         time_limit=None,
-        channels_first=True
+        channels_first=True,
+        fast_step=False,
+        internal_state=False,
+        fast_frame_skip=False,
+        frame_stack=1,
+        cache_model=False
 ):
     env_id = 'dmc_%s_%s_%s-v1' % (domain_name, task_name, seed)
 
+    if frame_stack > 1:
+        assert from_pixels and channels_first, 'frame stacking needs channels-first pixel observations'
+
     if from_pixels:
         assert not visualize_reward, 'cannot use visualize reward when learning from pixels'
 
     # shorten episode length
     max_episode_steps = (episode_length + frame_skip - 1) // frame_skip
 
-    if not env_id in gym.envs.registry.env_specs:
-        task_kwargs = {}
-        if seed is not None:
-            task_kwargs['random'] = seed
-        if time_limit is not None:
-            task_kwargs['time_limit'] = time_limit
-        register(
-            id=env_id,
-            entry_point='dmc2gym.wrappers:DMCWrapper',
-            kwargs=dict(
-                domain_name=domain_name,
-                task_name=task_name,
-                task_kwargs=task_kwargs,
-                environment_kwargs=environment_kwargs,
-                visualize_reward=visualize_reward,
-                from_pixels=from_pixels,
-                height=height,
-                width=width,
-                camera_id=camera_id,
-                frame_skip=frame_skip,
-                channels_first=channels_first,
-            ),
-            max_episode_steps=max_episode_steps,
+    task_kwargs = {}
+    if seed is not None:
+        task_kwargs['random'] = seed
+    if time_limit is not None:
+        task_kwargs['time_limit'] = time_limit
+    kwargs = dict(
+        domain_name=domain_name,
+        task_name=task_name,
+        task_kwargs=task_kwargs,
+        environment_kwargs=environment_kwargs,
+        visualize_reward=visualize_reward,
+        from_pixels=from_pixels,
+        height=height,
+        width=width,
+        camera_id=camera_id,
+        frame_skip=frame_skip,
+        channels_first=channels_first,
+    )
+
+    if cache_model:
+        # skip the gym registry, and reuse the compiled model of this
+        # (domain, task) across seeds
+        from dmc2gym.wrappers import DMCWrapper
+        env = DMCWrapper(
+            fast_step=fast_step,
+            internal_state=internal_state,
+            fast_frame_skip=fast_frame_skip,
+            cache_model=True,
+            **kwargs
+        )
+        # only add a TimeLimit layer if it can end episodes before the suite does
+        suite_steps = math.ceil(env._env._step_limit / frame_skip)
+        if max_episode_steps < suite_steps:
+            env = TimeLimit(env, max_episode_steps=max_episode_steps)
+    else:
+        if not env_id in gym.envs.registry.env_specs:
+            register(
+                id=env_id,
+                entry_point='dmc2gym.wrappers:DMCWrapper',
+                kwargs=kwargs,
+                max_episode_steps=max_episode_steps,
+            )
+        env = gym.make(
+            env_id,
+            fast_step=fast_step,
+            internal_state=internal_state,
+            fast_frame_skip=fast_frame_skip,
         )
-    return gym.make(env_id)
+    if frame_stack > 1:
+        from dmc2gym.wrappers import FrameStack
+        env = FrameStack(env, frame_stack)
+    return env
@@ -0,0 +1,118 @@
+import argparse
+import time
+
+import numpy as np
+
+from dm_control import suite
+
+from dmc2gym.rendering import PixelRenderer
+from dmc2gym.wrappers import DMCWrapper
+
+
+def benchmark(domain_name, task_name, steps=5000, seed=1, **wrapper_kwargs):
+    """Returns the env steps per second of a ``DMCWrapper`` under random actions."""
+    env = DMCWrapper(
+        domain_name=domain_name,
+        task_name=task_name,
+        task_kwargs={'random': seed},
+        visualize_reward=False,
+        **wrapper_kwargs
+    )
+    rng = np.random.RandomState(seed)
+    actions = rng.uniform(-1, 1, size=(steps,) + env.action_space.shape).astype(np.float32)
+
+    env.reset()
+    start = time.time()
+    for action in actions:
+        _, _, done, _ = env.step(action)
+        if done:
+            env.reset()
+    return steps / (time.time() - start)
+
+
+def benchmark_render(domain_name, task_name, frames=1000, num_envs=1, size=84):
+    """Returns frames per second of ``Physics.render`` and of ``PixelRenderer``."""
+    envs = [suite.load(domain_name, task_name, task_kwargs={'random': i})
+            for i in range(num_envs)]
+    for env in envs:
+        env.reset()
+    physics = [env.physics for env in envs]
+
+    start = time.time()
+    for _ in range(frames // num_envs):
+        for p in physics:
+            p.render(size, size, camera_id=0).transpose(2, 0, 1).copy()
+    baseline = frames / (time.time() - start)
+
+    renderer = PixelRenderer(physics, size, size, camera_id=0)
+    out = np.empty((num_envs,) + renderer.frame_shape, dtype=np.uint8)
+    start = time.time()
+    for _ in range(frames // num_envs):
+        renderer.render(out)
+    persistent = frames / (time.time() - start)
+    renderer.close()
+    return baseline, persistent
+
+
+def benchmark_construction(domain_name, task_name, instances=20):
+    """Returns seconds per ``DMCWrapper`` construction, without and with ``cache_model``."""
+    results = []
+    for cache_model in (False, True):
+        start = time.time()
+        for seed in range(instances):
+            DMCWrapper(
+                domain_name=domain_name,
+                task_name=task_name,
+                task_kwargs={'random': seed},
+                visualize_reward=False,
+                cache_model=cache_model
+            )
+        results.append((time.time() - start) / instances)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DMCWrapper.step throughput.')
+    parser.add_argument('--envs', nargs='*', default=['walker:walk', 'quadruped:walk'])
+    parser.add_argument('--steps', type=int, default=5000)
+    parser.add_argument('--frame_skip', type=int, default=1)
+    parser.add_argument('--render', action='store_true',
+                        help='Benchmark pixel rendering instead of stepping')
+    parser.add_argument('--num_envs', type=int, default=1)
+    parser.add_argument('--construct', action='store_true',
+                        help='Benchmark env construction instead of stepping')
+    args = parser.parse_args()
+
+    if args.construct:
+        for env_name in args.envs:
+            domain_name, task_name = env_name.split(':')
+            load, cached = benchmark_construction(domain_name, task_name)
+            print('%-20s %-12s %10.2f ms/env' % (env_name, 'suite.load', 1e3 * load))
+            print('%-20s %-12s %10.2f ms/env' % (env_name, 'cache_model', 1e3 * cached))
+        return
+
+    if args.render:
+        for env_name in args.envs:
+            domain_name, task_name = env_name.split(':')
+            baseline, persistent = benchmark_render(
+                domain_name, task_name, args.steps, args.num_envs)
+            print('%-20s %-12s %10.0f frames/s' % (env_name, 'render', baseline))
+            print('%-20s %-12s %10.0f frames/s' % (env_name, 'renderer', persistent))
+        return
+
+    modes = [
+        ('default', dict()),
+        ('fast_step', dict(fast_step=True)),
+    ]
+    if args.frame_skip > 1:
+        modes.append(('fast_skip', dict(fast_step=True, fast_frame_skip=True)))
+    for env_name in args.envs:
+        domain_name, task_name = env_name.split(':')
+        for mode, kwargs in modes:
+            sps = benchmark(domain_name, task_name, args.steps,
+                            frame_skip=args.frame_skip, **kwargs)
+            print('%-20s %-12s %10.0f steps/s' % (env_name, mode, sps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import numpy as np
+from dm_control.mujoco.engine import Camera
+
+
+class PixelRenderer:
+    """Offscreen renderer for one or more dm_control physics instances.
+
+    ``Physics.render`` builds (and frees) a new ``Camera`` with its own
+    ``MjvScene`` on every call. This keeps one camera per physics alive, so
+    the GL context, scene and pixel buffer are allocated once, and copies
+    each frame straight into a uint8 output batch, channels-first by default.
+
+    No window is ever opened. To render without a display, select an
+    offscreen backend before dm_control is imported, e.g. ``MUJOCO_GL=egl``
+    (GPU) or ``MUJOCO_GL=osmesa`` (software).
+
+    Example, rendering several envs into one ``(N, 3, H, W)`` batch:
+
+    .. code-block:: python
+
+        renderer = PixelRenderer([env.physics for env in envs], 84, 84)
+        frames = renderer.render()
+    """
+
+    def __init__(self, physics, height=84, width=84, camera_id=0, channels_first=True):
+        if not isinstance(physics, (list, tuple)):
+            physics = [physics]
+        self._cameras = [
+            Camera(p, height=height, width=width, camera_id=camera_id) for p in physics
+        ]
+        self._channels_first = channels_first
+        self.frame_shape = (3, height, width) if channels_first else (height, width, 3)
+
+    def render(self, out=None):
+        """Renders every physics into ``out`` (allocated if not given) and returns it."""
+        if out is None:
+            out = np.empty((len(self._cameras),) + self.frame_shape, dtype=np.uint8)
+        for camera, frame in zip(self._cameras, out):
+            img = camera.render()
+            np.copyto(frame, img.transpose(2, 0, 1) if self._channels_first else img)
+        return out
+
+    def close(self):
+        for camera in self._cameras:
+            camera.scene.free()
+        self._cameras = []
@@ -1,14 +1,19 @@
+from collections import deque
+import copy
 from gym import core, spaces
 from dm_control import suite
+from dm_control.rl import control
+import dm_env
 from dm_env import specs
 import numpy as np
-from diayn.utils import OpenCVImageViewer
+from diayn.utils import OpenCVImageViewer, get_control_state, set_control_state
+from dmc2gym.rendering import PixelRenderer
 
 
 def _spec_to_box(spec, dtype):
     def extract_min_max(s):
         assert s.dtype == np.float64 or s.dtype == np.float32
-        dim = np.int(np.prod(s.shape))
+        dim = int(np.prod(s.shape))
         if type(s) == specs.Array:
             bound = np.inf * np.ones(dim, dtype=np.float32)
             return -bound, bound
@@ -27,7 +32,15 @@ def _spec_to_box(spec, dtype):
     return spaces.Box(low, high, dtype=dtype)
 
 
-def _flatten_obs(obs):
+def _flatten_obs(obs, out=None):
+    if out is not None:
+        # write each piece straight into a preallocated buffer
+        start = 0
+        for v in obs.values():
+            size = np.size(v)
+            out[start:start + size] = np.ravel(v)
+            start += size
+        return out
     obs_pieces = []
     for v in obs.values():
         flat = np.array([v]) if np.isscalar(v) else v.ravel()
@@ -35,6 +48,48 @@ def _flatten_obs(obs):
     return np.concatenate(obs_pieces, axis=0)
 
 
+# prototype suite environments, keyed by everything but the seed; they are
+# never stepped, only copied
+_SUITE_ENVS = {}
+
+
+def _load_suite_env(domain_name, task_name, task_kwargs, visualize_reward, environment_kwargs):
+    """
+    Same as ``suite.load``, but parses and compiles each model only once.
+
+    Later instances get a physics with their own copy of the cached
+    ``MjModel`` (tasks such as reacher write to the model on every reset)
+    and a copy of the cached task whose random state is reseeded, so the
+    result behaves exactly as a freshly loaded environment with the same
+    seed.
+    """
+    task_kwargs = dict(task_kwargs)
+    seed = task_kwargs.pop('random', None)
+    key = (
+        domain_name,
+        task_name,
+        repr(sorted(task_kwargs.items())),
+        repr(environment_kwargs),
+        repr(visualize_reward),
+    )
+    if key not in _SUITE_ENVS:
+        _SUITE_ENVS[key] = suite.load(
+            domain_name=domain_name,
+            task_name=task_name,
+            task_kwargs=task_kwargs,
+            visualize_reward=visualize_reward,
+            environment_kwargs=environment_kwargs
+        )
+    proto = _SUITE_ENVS[key]
+    physics = proto.physics.copy(share_model=False)
+    env = copy.deepcopy(proto, memo={id(proto.physics): physics})
+    if isinstance(seed, np.random.RandomState):
+        env.task._random = seed
+    else:
+        env.task.random.seed(seed)
+    return env
+
+
 class DMCWrapper(core.Env):
     def __init__(
         self,
@@ -48,7 +103,11 @@ class DMCWrapper(core.Env):
         camera_id=0,
         frame_skip=1,
         environment_kwargs=None,
-        channels_first=True
+        channels_first=True,
+        fast_step=False,
+        internal_state=False,
+        fast_frame_skip=False,
+        cache_model=False
     ):
         assert 'random' in task_kwargs, 'please specify a seed, for deterministic behaviour'
         self._from_pixels = from_pixels
@@ -57,10 +116,15 @@ class DMCWrapper(core.Env):
         self._camera_id = camera_id
         self._frame_skip = frame_skip
         self._channels_first = channels_first
+        self._fast_step = fast_step
+        self._internal_state = internal_state
+        self._fast_frame_skip = fast_frame_skip
         self.viewer = None
+        self._renderer = None
 
         # create task
-        self._env = suite.load(
+        load = _load_suite_env if cache_model else suite.load
+        self._env = load(
             domain_name=domain_name,
             task_name=task_name,
             task_kwargs=task_kwargs,
@@ -77,6 +141,15 @@ class DMCWrapper(core.Env):
             dtype=np.float32
         )
 
+        # precompute the affine map from normalized to true actions
+        self._true_delta = self._true_action_space.high.astype(np.float64) - self._true_action_space.low
+        self._norm_delta = self._norm_action_space.high.astype(np.float64) - self._norm_action_space.low
+        self._action_scale = (self._true_delta / self._norm_delta).astype(np.float32)
+        self._action_offset = (
+            self._true_action_space.low - self._norm_action_space.low * self._action_scale
+        ).astype(np.float32)
+        self._action_buf = np.zeros(self._true_action_space.shape, dtype=np.float32)
+
         # create observation space
         if from_pixels:
             shape = [3, height, width] if channels_first else [height, width, 3]
@@ -93,7 +166,8 @@ class DMCWrapper(core.Env):
             self._env.observation_spec().values(),
             np.float64
         )
-        
+        self._state_buf = np.zeros(self._state_space.shape, dtype=np.float64)
+
         self.current_state = None
 
         # set seed
@@ -104,26 +178,66 @@ class DMCWrapper(core.Env):
 
     def _get_obs(self, time_step):
         if self._from_pixels:
-            obs = self.render(
-                height=self._height,
-                width=self._width,
-                camera_id=self._camera_id
-            )
-            if self._channels_first:
-                obs = obs.transpose(2, 0, 1).copy()
+            # offscreen, with a persistent camera; never opens a window
+            if self._renderer is None:
+                self._renderer = PixelRenderer(
+                    self._env.physics,
+                    height=self._height,
+                    width=self._width,
+                    camera_id=self._camera_id,
+                    channels_first=self._channels_first
+                )
+            obs = self._renderer.render()[0]
         else:
             obs = _flatten_obs(time_step.observation)
         return obs
 
     def _convert_action(self, action):
         action = action.astype(np.float64)
-        true_delta = self._true_action_space.high - self._true_action_space.low
-        norm_delta = self._norm_action_space.high - self._norm_action_space.low
-        action = (action - self._norm_action_space.low) / norm_delta
-        action = action * true_delta + self._true_action_space.low
+        action = (action - self._norm_action_space.low) / self._norm_delta
+        action = action * self._true_delta + self._true_action_space.low
         action = action.astype(np.float32)
         return action
 
+    def _fast_convert_action(self, action):
+        # single fused multiply-add into a reused buffer, no bound checks
+        np.multiply(action, self._action_scale, out=self._action_buf)
+        self._action_buf += self._action_offset
+        return self._action_buf
+
+    def _substep(self, action):
+        # control.Environment.step without building the observation
+        env = self._env
+        env.task.before_step(action, env.physics)
+        env.physics.step(env._n_sub_steps)
+        env.task.after_step(env.physics)
+        reward = env.task.get_reward(env.physics)
+        env._step_count += 1
+        if env._step_count >= env._step_limit:
+            return reward, 1.0
+        return reward, env.task.get_termination(env.physics)
+
+    def _skip_frames(self, action):
+        # only the last substep pays for a full TimeStep, the ones
+        # before it just advance physics and accumulate the reward
+        env = self._env
+        reward = 0
+        if not env._reset_next_step:
+            for _ in range(self._frame_skip - 1):
+                substep_reward, discount = self._substep(action)
+                reward += substep_reward or 0
+                if discount is not None:
+                    env._reset_next_step = True
+                    observation = env.task.get_observation(env.physics)
+                    if env._flat_observation:
+                        observation = control.flatten_observation(observation)
+                    time_step = dm_env.TimeStep(
+                        dm_env.StepType.LAST, substep_reward, discount, observation
+                    )
+                    return reward, time_step
+        time_step = env.step(action)
+        return reward + (time_step.reward or 0), time_step
+
     @property
     def observation_space(self):
         return self._observation_space
@@ -145,21 +259,48 @@ class DMCWrapper(core.Env):
         self._norm_action_space.seed(seed)
         self._observation_space.seed(seed)
 
+    def get_state(self):
+        """Everything needed to continue the current episode, see ``set_state``."""
+        return dict(
+            env=get_control_state(self._env),
+            action_space=copy.deepcopy(self._norm_action_space),
+            current_state=copy.deepcopy(self.current_state),
+        )
+
+    def set_state(self, state):
+        """Restore the episode and the action sampler saved by ``get_state``."""
+        set_control_state(self._env, state['env'])
+        self._norm_action_space = copy.deepcopy(state['action_space'])
+        self.current_state = copy.deepcopy(state['current_state'])
+
     def step(self, action):
-        assert self._norm_action_space.contains(action)
-        action = self._convert_action(action)
-        assert self._true_action_space.contains(action)
+        if self._fast_step:
+            action = self._fast_convert_action(action)
+        else:
+            assert self._norm_action_space.contains(action)
+            action = self._convert_action(action)
+            assert self._true_action_space.contains(action)
         reward = 0
-        extra = {'internal_state': self._env.physics.get_state().copy()}
+        extra = {}
+        if self._internal_state:
+            extra['internal_state'] = self._env.physics.get_state().copy()
 
-        for _ in range(self._frame_skip):
-            time_step = self._env.step(action)
-            reward += time_step.reward or 0
+        if self._fast_frame_skip:
+            reward, time_step = self._skip_frames(action)
             done = time_step.last()
-            if done:
-                break
-        obs = self._get_obs(time_step)
-        self.current_state = _flatten_obs(time_step.observation)
+        else:
+            for _ in range(self._frame_skip):
+                time_step = self._env.step(action)
+                reward += time_step.reward or 0
+                done = time_step.last()
+                if done:
+                    break
+        if self._fast_step:
+            self.current_state = _flatten_obs(time_step.observation, out=self._state_buf)
+            obs = self._get_obs(time_step) if self._from_pixels else self.current_state.copy()
+        else:
+            obs = self._get_obs(time_step)
+            self.current_state = _flatten_obs(time_step.observation)
         extra['discount'] = time_step.discount
         return obs, reward, done, extra
 
@@ -174,8 +315,55 @@ class DMCWrapper(core.Env):
             kwargs["camera_id"] = 0  # Tracking camera
 
         img = self._env.physics.render(**kwargs)
-        if self.viewer is None:
+        if self.viewer is None and mode == "human":
             self.viewer = OpenCVImageViewer()
 
-        self.viewer.imshow(img)
-        return self.viewer.isopen
+        if self.viewer:
+            self.viewer.imshow(img)
+
+        return img
+
+    def close(self):
+        if self._renderer is not None:
+            self._renderer.close()
+            self._renderer = None
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
+        return self._env.close()
+
+
+class FrameStack(core.Wrapper):
+    """Stacks the last ``k`` channels-first pixel observations.
+
+    Frames are concatenated oldest first along the channel axis. On reset
+    the first frame is repeated ``k`` times.
+    """
+
+    def __init__(self, env, k):
+        core.Wrapper.__init__(self, env)
+        self._k = k
+        self._frames = deque([], maxlen=k)
+        shp = env.observation_space.shape
+        self.observation_space = spaces.Box(
+            low=0,
+            high=255,
+            shape=((shp[0] * k,) + shp[1:]),
+            dtype=env.observation_space.dtype
+        )
+        self._max_episode_steps = getattr(env, '_max_episode_steps', None)
+
+    def reset(self):
+        obs = self.env.reset()
+        for _ in range(self._k):
+            self._frames.append(obs)
+        return self._get_obs()
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self._frames.append(obs)
+        return self._get_obs(), reward, done, info
+
+    def _get_obs(self):
+        assert len(self._frames) == self._k
+        return np.concatenate(list(self._frames), axis=0)
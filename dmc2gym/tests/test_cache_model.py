@@ -0,0 +1,38 @@
+import unittest
+
+import numpy as np
+
+from dmc2gym.wrappers import DMCWrapper
+
+
+def make(seed, cache_model):
+    return DMCWrapper('reacher', 'easy', task_kwargs={'random': seed},
+                      visualize_reward=True, cache_model=cache_model)
+
+
+def rollout(env, steps=20):
+    obs = [env.reset()]
+    for t in range(steps):
+        obs.append(env.step(np.full(env.action_space.shape, np.sin(t), np.float32))[0])
+    return np.array(obs)
+
+
+class TestCacheModel(unittest.TestCase):
+    def test_cached_envs_are_independent(self):
+        ''' Cached envs behave like fresh ones, even when reset in between '''
+        a, b = make(1, True), make(2, True)
+        a.reset()
+        # reacher moves its target in the model on every reset
+        b.reset()
+        a_obs = [a.step(np.zeros(a.action_space.shape, np.float32))[0]]
+        fresh = make(1, False)
+        fresh.reset()
+        fresh_obs = [fresh.step(np.zeros(fresh.action_space.shape, np.float32))[0]]
+        np.testing.assert_array_equal(a_obs, fresh_obs)
+
+    def test_same_seed_same_rollout(self):
+        np.testing.assert_array_equal(rollout(make(3, True)), rollout(make(3, False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
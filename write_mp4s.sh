@@ -1,10 +1,11 @@
 #!/usr/bin/env bash
 
 ARG1=${1:-'data/UA1Still-v0/new_rew/new_rew_s0'}
+ARG2=${2:-'UA1Still-v0'}
 
 for ((i=0; i<=19; i++))
 do
     echo "Exporting skill $i"
-    # framerate 50 based on 0.02 DMC control_timestep
-    ffmpeg -framerate 50 -pattern_type glob -i "$ARG1/$i/*.jpg" -c:v libx264 -pix_fmt yuv420p "$ARG1/$i/$i.mp4"
+    # test_policy --write encodes $ARG1/$i/$i.mp4 directly (50 fps from the 0.02 DMC control_timestep)
+    python diayn/spinningup/spinup/utils/test_policy.py "$ARG1" --env_id "$ARG2" --norender --write --skill "$i"
 done